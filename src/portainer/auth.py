@@ -0,0 +1,162 @@
+"""Class to manage the Portainer JWT."""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from .exceptions import PortainerException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def decode_jwt_expiry(token: str) -> float | None:
+    """Return the ``exp`` claim of a JWT, or None when it can't be read."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    expiry = claims.get("exp")
+    if isinstance(expiry, (int, float)):
+        return float(expiry)
+    return None
+
+
+class PortainerTokenManager:
+    """Holds the JWT and coalesces concurrent re-logins into one request."""
+
+    def __init__(
+        self,
+        login: Callable[[], Awaitable[str]],
+        refresh_margin: float = 60,
+    ) -> None:
+        """Constructor method."""
+        self._login = login
+        self._refresh_margin = refresh_margin
+        self._token: str | None = None
+        self._expires_at: float | None = None
+        self._refresh_at: float | None = None
+        self._login_task: asyncio.Task[str] | None = None
+        self._refresh_task: asyncio.Task[None] | None = None
+
+    @property
+    def token(self) -> str | None:
+        """Return the current token."""
+        return self._token
+
+    @property
+    def expires_at(self) -> float | None:
+        """Return the token expiry as a unix timestamp."""
+        return self._expires_at
+
+    def expires_soon(self) -> bool:
+        """Return True when the token is within the refresh margin."""
+        if self._refresh_at is None:
+            return False
+        return time.time() >= self._refresh_at
+
+    def set_token(self, token: str) -> None:
+        """Store a new token and schedule its background refresh."""
+        self._token = token
+        self._expires_at = expires_at = decode_jwt_expiry(token)
+        self._refresh_at = None
+        lifetime = (expires_at or 0) - time.time()
+        if expires_at is not None and lifetime > 0:
+            # Short lived tokens are refreshed halfway instead of in a loop,
+            # already expired ones (clock skew) are left to the 401 handling
+            margin = min(self._refresh_margin, lifetime / 2)
+            self._refresh_at = expires_at - margin
+        self._schedule_refresh()
+
+    async def get_token(self) -> str | None:
+        """Return a valid token, refreshing it first when it is about to expire.
+
+        When the refresh fails the current token is returned as long as it
+        hasn't expired, a later request or a 401 tries again.
+
+        Raises:
+            PortainerException: The refresh failed and the token expired.
+        """
+        if self._token is not None and self.expires_soon():
+            try:
+                return await self.refresh()
+            except PortainerException as exp:
+                if self._expires_at is None or time.time() >= self._expires_at:
+                    raise
+                _LOGGER.debug("Token refresh failed, using the current one: %s", exp)
+        return self._token
+
+    async def refresh(self, stale_token: str | None = None) -> str:
+        """Log in again, sharing one in-flight login between all callers.
+
+        When ``stale_token`` is given and the current token already differs
+        from it, another caller refreshed in the meantime and no new login is
+        done.
+        """
+        if (
+            stale_token is not None
+            and self._token is not None
+            and self._token != stale_token
+        ):
+            return self._token
+        if self._login_task is None or self._login_task.done():
+            self._login_task = asyncio.ensure_future(self._do_login())
+        return await asyncio.shield(self._login_task)
+
+    async def _do_login(self) -> str:
+        """Execute the login and store the token."""
+        token = await self._login()
+        self.set_token(token)
+        return token
+
+    def _schedule_refresh(self) -> None:
+        """Schedule a refresh ahead of the token expiry."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        self._refresh_task = None
+        if self._refresh_at is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._refresh_task = loop.create_task(self._refresh_ahead())
+
+    async def _refresh_ahead(self) -> None:
+        """Sleep until the refresh margin is reached and refresh the token."""
+        if self._refresh_at is None:
+            return
+        delay = self._refresh_at - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self.refresh()
+        except Exception as exp:  # pylint: disable=broad-except
+            # The next request refreshes the token on demand.
+            _LOGGER.debug("Background token refresh failed: %s", exp)
+
+    def clear(self) -> None:
+        """Forget the token and stop the background refresh."""
+        self._token = None
+        self._expires_at = None
+        self._refresh_at = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def close(self) -> None:
+        """Cancel the background refresh."""
+        task = self._refresh_task
+        self.clear()
+        if task is not None:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,176 @@
+"""Bounded-concurrency bulk operations on docker containers and stacks."""
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable
+
+if TYPE_CHECKING:
+    from .cache import PortainerImageStatusCache
+    from .docker_container import PortainerDockerContainer
+
+BULK_ACTIONS = (
+    "start",
+    "stop",
+    "restart",
+    "recreate",
+    "refresh",
+    "get_stats",
+    "get_image_status",
+)
+
+
+class PortainerBulkResult:
+    """Outcome of a bulk operation for one container or stack."""
+
+    def __init__(
+        self,
+        item: Any,
+        result: Any = None,
+        exception: BaseException | None = None,
+    ) -> None:
+        """Constructor method."""
+        self.item = item
+        self.result = result
+        self.exception = exception
+
+    @property
+    def container(self) -> Any:
+        """Return the item of a container operation."""
+        return self.item
+
+    @property
+    def success(self) -> bool:
+        """Return True when the action did not raise."""
+        return self.exception is None
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        outcome = "ok" if self.success else repr(self.exception)
+        return (
+            f"<PortainerBulkResult {self.item.endpoint_id}/"
+            f"{self.item.name}: {outcome}>"
+        )
+
+
+def _get_action(
+    action: str | Callable[..., Awaitable[Any]]
+) -> Callable[..., Awaitable[Any]]:
+    """Return a callable taking the item as first argument."""
+    if callable(action):
+        return action
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unsupported bulk action: {action}")
+
+    async def call(item: Any, **kwargs: Any) -> Any:
+        return await getattr(item, action)(**kwargs)
+
+    return call
+
+
+async def run_bulk(
+    items: Iterable[Any],
+    action: str | Callable[..., Awaitable[Any]],
+    limit: int = 10,
+    endpoint_limit: int | None = None,
+    order_by_endpoint: bool = True,
+    **kwargs: Any,
+) -> list[PortainerBulkResult]:
+    """Run an action on many containers or stacks with bounded concurrency.
+
+    ``limit`` bounds the total number of concurrent calls and
+    ``endpoint_limit`` the number of concurrent calls per endpoint. Failures
+    are returned in the result of their item instead of cancelling the
+    other calls. Results are returned in the order of ``items``. Items need
+    ``endpoint_id`` and ``name`` attributes.
+
+    Raises:
+        ValueError: A limit is lower than 1.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    if endpoint_limit is not None and endpoint_limit < 1:
+        raise ValueError("endpoint_limit must be at least 1")
+    func = _get_action(action)
+    items = list(items)
+    semaphore = asyncio.Semaphore(limit)
+    endpoint_semaphores: dict[Any, asyncio.Semaphore] = {}
+
+    async def run(item: Any) -> PortainerBulkResult:
+        endpoint_semaphore = None
+        if endpoint_limit is not None:
+            endpoint_semaphore = endpoint_semaphores.setdefault(
+                item.endpoint_id, asyncio.Semaphore(endpoint_limit)
+            )
+        try:
+            if endpoint_semaphore is not None:
+                await endpoint_semaphore.acquire()
+            try:
+                async with semaphore:
+                    result = await func(item, **kwargs)
+            finally:
+                if endpoint_semaphore is not None:
+                    endpoint_semaphore.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exp:  # pylint: disable=broad-except
+            return PortainerBulkResult(item, exception=exp)
+        return PortainerBulkResult(item, result)
+
+    order = list(range(len(items)))
+    if order_by_endpoint:
+        # Tasks start in this order, keeping an endpoint's calls together
+        order.sort(key=lambda index: str(items[index].endpoint_id))
+    tasks = {index: asyncio.ensure_future(run(items[index])) for index in order}
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return [tasks[index].result() for index in range(len(items))]
+
+
+async def check_image_status(
+    containers: Iterable[PortainerDockerContainer],
+    cache: PortainerImageStatusCache | None = None,
+    limit: int = 5,
+) -> list[PortainerBulkResult]:
+    """Request the image status of many containers, once per image.
+
+    Containers are grouped on ``image`` and ``image_id``. Statuses in the
+    cache are reused, every other image is checked once through one of its
+    containers with at most ``limit`` checks at the same time. The status
+    or error is set on all containers of the image and returned in their
+    result, in the order of ``containers``.
+    """
+    containers = list(containers)
+    groups: dict[tuple[str, str], list[PortainerDockerContainer]] = {}
+    for container in containers:
+        groups.setdefault((container.image, container.image_id), []).append(container)
+
+    results: dict[tuple[str, str], PortainerBulkResult] = {}
+    unknown = []
+    for key, members in groups.items():
+        status = cache.get(key) if cache is not None else None
+        if status is None:
+            unknown.append(members[0])
+        else:
+            results[key] = PortainerBulkResult(members[0], status)
+
+    checked = await run_bulk(
+        unknown, "get_image_status", limit=limit, order_by_endpoint=False
+    )
+    for result in checked:
+        key = (result.item.image, result.item.image_id)
+        results[key] = result
+        if cache is not None and result.success:
+            cache.store(key, result.result)
+
+    bulk_results = []
+    for container in containers:
+        result = results[(container.image, container.image_id)]
+        if result.success:
+            container.image_status = result.result
+        bulk_results.append(
+            PortainerBulkResult(container, result.result, result.exception)
+        )
+    return bulk_results
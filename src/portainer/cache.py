@@ -0,0 +1,234 @@
+"""Cache for Portainer API responses."""
+from __future__ import annotations
+
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Mapping
+from urllib.parse import urlencode
+
+from .const import API_ENDPOINTS, API_LICENCES, API_STATUS, API_VERSION
+from .helpers import get_environment_id
+
+DEFAULT_CACHE_TTLS: Mapping[str, float] = {
+    API_STATUS: 60,
+    API_VERSION: 3600,
+    API_LICENCES: 3600,
+    API_ENDPOINTS: 10,
+}
+
+
+class PortainerCacheEntry:
+    """A cached API response."""
+
+    __slots__ = (
+        "api",
+        "environment_id",
+        "response",
+        "size",
+        "expires",
+        "etag",
+        "last_modified",
+    )
+
+    def __init__(self, api: str, response: dict, ttl: float) -> None:
+        """Constructor method."""
+        headers = response.get("headers") or {}
+        self.api = api
+        self.environment_id = get_environment_id(api)
+        self.response = response
+        self.size: int = response.get("size", 0)
+        self.expires = time.monotonic() + ttl
+        self.etag: str | None = headers.get("ETag")
+        self.last_modified: str | None = headers.get("Last-Modified")
+
+    @property
+    def fresh(self) -> bool:
+        """Return True when the entry is within its TTL."""
+        return time.monotonic() < self.expires
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Return the headers to revalidate the entry with the server."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PortainerResponseCache:
+    """LRU cache of GET responses with a TTL per API.
+
+    Only the APIs in ``ttls`` are cached. Expired entries with an ``ETag`` or
+    ``Last-Modified`` header are revalidated with a conditional request.
+    Mutating requests invalidate the entries of their environment and the
+    endpoint listing. Cached responses are shared, treat them as read-only.
+    """
+
+    def __init__(
+        self,
+        ttls: Mapping[str, float] | None = None,
+        max_entries: int = 256,
+        max_bytes: int = 32 * 1024 * 1024,
+    ) -> None:
+        """Constructor method."""
+        self._ttls = dict(DEFAULT_CACHE_TTLS if ttls is None else ttls)
+        # APIs with placeholders like API_ENDPOINT match any value
+        self._template_ttls = [
+            (re.compile(re.sub(r"\\{\w+\\}", "[^/]+", re.escape(api)) + "$"), ttl)
+            for api, ttl in self._ttls.items()
+            if "{" in api
+        ]
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, PortainerCacheEntry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Return the size of the cached response bodies in bytes."""
+        return self._bytes
+
+    def ttl(self, api: str) -> float:
+        """Return the TTL of the responses of an API, 0 when not cached."""
+        path = api.split("?")[0]
+        if path in self._ttls:
+            return self._ttls[path]
+        for pattern, ttl in self._template_ttls:
+            if pattern.match(path):
+                return ttl
+        return 0
+
+    @staticmethod
+    def key(api: str, params: dict | None) -> str:
+        """Return the cache key of a GET request."""
+        if not params:
+            return api
+        return f"{api}?{urlencode(sorted(params.items()), doseq=True)}"
+
+    def get(self, key: str) -> PortainerCacheEntry | None:
+        """Return the entry of a key, fresh or not."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if entry.fresh:
+            self.hits += 1
+        return entry
+
+    def store(self, key: str, api: str, response: dict) -> None:
+        """Store a successful response."""
+        ttl = self.ttl(api)
+        if ttl <= 0:
+            return
+        entry = PortainerCacheEntry(api, response, ttl)
+        if entry.size > self._max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def revalidated(self, key: str) -> dict | None:
+        """Renew the TTL of an entry the server reported as not modified."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.revalidations += 1
+        entry.expires = time.monotonic() + self.ttl(entry.api)
+        return entry.response
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def invalidate(self, api: str) -> None:
+        """Drop the entries a mutating request on the API may have changed.
+
+        A request on an environment drops the entries of that environment, a
+        request on no specific environment drops those of all environments.
+        Both drop the endpoint listing.
+        """
+        environment_id = get_environment_id(api)
+        for key, entry in list(self._entries.items()):
+            if entry.environment_id is None:
+                stale = entry.api == API_ENDPOINTS
+            else:
+                stale = environment_id in (None, entry.environment_id)
+            if stale:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Return the cache statistics."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+        }
+
+
+class PortainerImageStatusCache:
+    """LRU cache of image update statuses, keyed by image and image id.
+
+    Containers running the same image share the status Portainer reports
+    for it, so one registry check covers all of them until ``ttl`` expires.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024) -> None:
+        """Constructor method."""
+        self.ttl = ttl
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return len(self._entries)
+
+    def get(self, key: tuple[str, str]) -> Any:
+        """Return the fresh status of an image, None when unknown or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, status = entry
+        if time.monotonic() >= expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return status
+
+    def store(self, key: tuple[str, str], status: Any) -> None:
+        """Store the status of an image."""
+        if self.ttl <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, status)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, image: str) -> None:
+        """Drop the statuses of an image, e.g. after pulling it."""
+        for key in [key for key in self._entries if key[0] == image]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
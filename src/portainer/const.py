@@ -1,6 +1,41 @@
 """Library constants."""
 from typing import Final
 
+# Endpoint status
+ENDPOINT_STATUS_UP: Final = 1
+ENDPOINT_STATUS_DOWN: Final = 2
+
+# Stack status
+STACK_STATUS_ACTIVE: Final = 1
+STACK_STATUS_INACTIVE: Final = 2
+
+# Request priorities of the rate limiter, lower goes first
+REQUEST_PRIORITY_HIGH: Final = 0
+REQUEST_PRIORITY_NORMAL: Final = 1
+REQUEST_PRIORITY_LOW: Final = 2
+REQUEST_PRIORITY_NAMES: Final = {0: "high", 1: "normal", 2: "low"}
+
+# Container state after a docker event, None for events that need a lookup
+DOCKER_EVENT_STATES: Final = {
+    "create": None,
+    "rename": None,
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+    "destroy": "removed",
+}
+
+# Headers
+HEADER_TOTAL_COUNT: Final = "X-Total-Count"
+
+# Docker log streams
+CONTENT_TYPE_MULTIPLEXED_STREAM: Final = "application/vnd.docker.multiplexed-stream"
+CONTENT_TYPE_RAW_STREAM: Final = "application/vnd.docker.raw-stream"
+DOCKER_LOG_STREAMS: Final = {0: "stdin", 1: "stdout", 2: "stderr"}
+
 # APIs
 API_AUTH: Final = "auth"
 API_ENDPOINTS: Final = "endpoints"
@@ -27,3 +62,15 @@ API_CONTAINER_RESTART: Final = (
 API_CONTAINER_SNAPSHOT: Final = (
     "docker/{environment_id}/snapshot/containers/{container_id}"
 )
+API_DOCKER_CONTAINERS: Final = "endpoints/{environment_id}/docker/containers/json"
+API_DOCKER_EVENTS: Final = "endpoints/{environment_id}/docker/events"
+
+API_STACKS: Final = "stacks"
+API_STACK: Final = "stacks/{stack_id}"
+API_STACK_FILE: Final = "stacks/{stack_id}/file"
+API_STACK_START: Final = "stacks/{stack_id}/start"
+API_STACK_STOP: Final = "stacks/{stack_id}/stop"
+API_STACK_GIT_REDEPLOY: Final = "stacks/{stack_id}/git/redeploy"
+API_CONTAINER_LOGS: Final = (
+    "endpoints/{environment_id}/docker/containers/{container_id}/logs"
+)
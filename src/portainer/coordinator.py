@@ -0,0 +1,283 @@
+"""Shared polling of Portainer endpoints."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+from .const import ENDPOINT_STATUS_UP
+from .endpoint import PortainerContainerDiff, PortainerEndpoint
+from .snapshot import PortainerSnapshotStore
+
+if TYPE_CHECKING:
+    from portainer import Portainer
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+Subscriber = Callable[[PortainerEndpoint, PortainerContainerDiff], None]
+
+
+class PortainerCoordinator:
+    """Owns the refresh scheduling of all endpoints and their containers.
+
+    Every endpoint is polled on its own interval: after a refresh that
+    changed containers the interval drops to ``min_interval``, every refresh
+    without changes multiplies it by ``backoff`` up to ``max_interval``.
+    Endpoints that are not up or fail to refresh are polled at
+    ``max_interval``. Container state comes from the endpoint snapshot, so
+    containers are not polled separately.
+
+    The endpoints in ``endpoints`` are the shared snapshot that all
+    subscribers read from. Concurrent refresh requests for the same endpoint
+    share one request.
+
+    With a ``store`` the endpoints saved by the previous run are served,
+    marked ``stale``, right after start() and reconciled in the background:
+    only endpoints whose ``QueryDate`` changed are requested again. The
+    store is saved after reconciling and on stop().
+    """
+
+    def __init__(
+        self,
+        portainer: Portainer,
+        interval: float = 30,
+        min_interval: float = 5,
+        max_interval: float = 300,
+        backoff: float = 2,
+        jitter: float = 0.1,
+        discovery_interval: float = 300,
+        store: PortainerSnapshotStore | None = None,
+    ) -> None:
+        """Constructor method."""
+        self._portainer = portainer
+        self._interval = interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._jitter = jitter
+        self._discovery_interval = discovery_interval
+        self._store = store
+
+        self.endpoints: dict[int, PortainerEndpoint] = {}
+        self._intervals: dict[int, float] = {}
+        self._subscribers: list[tuple[int | None, Subscriber]] = []
+        self._in_flight: dict[Any, asyncio.Future[Any]] = {}
+        self._tasks: dict[Any, asyncio.Task[None]] = {}
+
+    def subscribe(
+        self, subscriber: Subscriber, endpoint_id: int | None = None
+    ) -> Callable[[], None]:
+        """Call the subscriber with the container changes of an (or every) endpoint.
+
+        Returns a function that removes the subscription.
+        """
+        entry = (endpoint_id, subscriber)
+        self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            if entry in self._subscribers:
+                self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def _dispatch(
+        self, endpoint: PortainerEndpoint, diff: PortainerContainerDiff
+    ) -> None:
+        """Pass the changes of an endpoint to its subscribers."""
+        for endpoint_id, subscriber in list(self._subscribers):
+            if endpoint_id is None or endpoint_id == endpoint.endpoint_id:
+                try:
+                    subscriber(endpoint, diff)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error in subscriber %s", subscriber)
+
+    async def _shared(self, key: Any, factory: Callable[[], Awaitable[_T]]) -> _T:
+        """Run the coroutine of factory once for all concurrent callers."""
+        future: asyncio.Future[_T] | None = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def refresh_endpoints(self) -> dict[int, PortainerEndpoint]:
+        """Request all endpoints and update the shared snapshot."""
+        return await self._shared("endpoints", self._refresh_endpoints)
+
+    async def _refresh_endpoints(self) -> dict[int, PortainerEndpoint]:
+        """Request all endpoints, add new ones and drop vanished ones."""
+        self._merge_endpoints(await self._portainer.get_raw_endpoints())
+        return self.endpoints
+
+    def _add_endpoint(self, endpoint: PortainerEndpoint) -> None:
+        """Add an endpoint to the shared snapshot."""
+        endpoint.add_listener(self._dispatch)
+        self.endpoints[endpoint.endpoint_id] = endpoint
+        self._intervals[endpoint.endpoint_id] = self._interval
+        if self._tasks:
+            self._start_endpoint(endpoint.endpoint_id)
+
+    def _merge_endpoints(self, raw_endpoints: list[dict]) -> None:
+        """Update, add and drop endpoints to match the requested ones."""
+        seen = set()
+        for raw_endpoint in raw_endpoints:
+            endpoint_id = raw_endpoint["Id"]
+            seen.add(endpoint_id)
+            if endpoint_id in self.endpoints:
+                self._after_refresh(
+                    self.endpoints[endpoint_id],
+                    self.endpoints[endpoint_id].after_refresh(raw_endpoint),
+                )
+                continue
+            self._add_endpoint(PortainerEndpoint(self._portainer, raw_endpoint))
+        for endpoint_id in set(self.endpoints) - seen:
+            del self.endpoints[endpoint_id]
+            del self._intervals[endpoint_id]
+            task = self._tasks.pop(endpoint_id, None)
+            if task is not None:
+                task.cancel()
+
+    async def reconcile(self) -> None:
+        """Refresh the endpoints that changed since they were loaded.
+
+        Lists the endpoints without snapshots and compares their
+        ``QueryDate``: unchanged endpoints are no longer stale, changed and
+        new ones are refreshed. Endpoints that fail to refresh stay stale
+        with their previous ``QueryDate``. Saves the store afterwards.
+        """
+        raw_endpoints = await self._portainer.get_raw_endpoints(exclude_snapshots=True)
+        changed = []
+        unchanged = []
+        merged = []
+        for raw_endpoint in raw_endpoints:
+            endpoint = self.endpoints.get(raw_endpoint["Id"])
+            if endpoint is not None and endpoint.time == raw_endpoint["QueryDate"]:
+                unchanged.append(endpoint)
+                merged.append(raw_endpoint)
+                continue
+            changed.append(raw_endpoint["Id"])
+            # Only a successful refresh takes over the new QueryDate
+            query_date = endpoint.time if endpoint is not None else None
+            merged.append({**raw_endpoint, "QueryDate": query_date})
+        self._merge_endpoints(merged)
+        for endpoint in unchanged:
+            endpoint.stale = False
+        for endpoint_id in changed:
+            self.endpoints[endpoint_id].stale = True
+        results = await asyncio.gather(
+            *(self.refresh_endpoint(endpoint_id) for endpoint_id in changed),
+            return_exceptions=True,
+        )
+        for endpoint_id, result in zip(changed, results, strict=True):
+            if isinstance(result, Exception):
+                _LOGGER.debug("Refreshing endpoint %s failed: %s", endpoint_id, result)
+        await self.save_snapshot()
+
+    async def save_snapshot(self) -> None:
+        """Save the endpoints to the store, if any.
+
+        The file is written in the default executor.
+        """
+        if self._store is not None:
+            records = self._store.encode(self.endpoints.values())
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._store.write, records
+            )
+
+    async def _reconcile(self) -> None:
+        """Reconcile the loaded endpoints in the background."""
+        try:
+            await self.reconcile()
+        except Exception as exp:  # pylint: disable=broad-except
+            _LOGGER.debug("Reconciling endpoints failed: %s", exp)
+
+    async def refresh_endpoint(self, endpoint_id: int) -> PortainerContainerDiff:
+        """Refresh one endpoint, sharing the request with concurrent callers."""
+        return await self._shared(
+            endpoint_id, lambda: self._refresh_endpoint(endpoint_id)
+        )
+
+    async def _refresh_endpoint(self, endpoint_id: int) -> PortainerContainerDiff:
+        """Refresh one endpoint and adapt its polling interval."""
+        endpoint = self.endpoints[endpoint_id]
+        try:
+            diff = await endpoint.refresh()
+        except Exception:
+            self._intervals[endpoint_id] = self._max_interval
+            raise
+        self._after_refresh(endpoint, diff)
+        return diff
+
+    def _after_refresh(
+        self, endpoint: PortainerEndpoint, diff: PortainerContainerDiff
+    ) -> None:
+        """Adapt the polling interval of an endpoint to its last refresh."""
+        interval = self._intervals.get(endpoint.endpoint_id, self._interval)
+        if endpoint.status != ENDPOINT_STATUS_UP:
+            interval = self._max_interval
+        elif diff:
+            interval = self._min_interval
+        else:
+            interval = min(interval * self._backoff, self._max_interval)
+        self._intervals[endpoint.endpoint_id] = interval
+
+    def _sleep_time(self, interval: float) -> float:
+        """Return the interval with jitter applied."""
+        return interval * random.uniform(  # noqa: S311
+            1 - self._jitter, 1 + self._jitter
+        )
+
+    async def _poll_endpoint(self, endpoint_id: int) -> None:
+        """Refresh an endpoint on its adaptive interval."""
+        while True:
+            await asyncio.sleep(self._sleep_time(self._intervals[endpoint_id]))
+            try:
+                await self.refresh_endpoint(endpoint_id)
+            except Exception as exp:  # pylint: disable=broad-except
+                _LOGGER.debug("Refreshing endpoint %s failed: %s", endpoint_id, exp)
+
+    async def _poll_discovery(self) -> None:
+        """Periodically look for added and removed endpoints."""
+        while True:
+            await asyncio.sleep(self._sleep_time(self._discovery_interval))
+            try:
+                await self.refresh_endpoints()
+            except Exception as exp:  # pylint: disable=broad-except
+                _LOGGER.debug("Refreshing endpoints failed: %s", exp)
+
+    def _start_endpoint(self, endpoint_id: int) -> None:
+        """Start polling an endpoint."""
+        self._tasks[endpoint_id] = asyncio.create_task(self._poll_endpoint(endpoint_id))
+
+    async def start(self) -> None:
+        """Request the endpoints and start polling them.
+
+        Endpoints loaded from the store are served at once and reconciled
+        in the background.
+        """
+        if self._tasks:
+            return
+        if self._store is not None and not self.endpoints:
+            # Not lazy, so the first refresh reports the changed containers
+            endpoints = self._store.load(self._portainer, lazy=False)
+            for endpoint in endpoints.values():
+                self._add_endpoint(endpoint)
+        if self.endpoints:
+            self._tasks["reconcile"] = asyncio.create_task(self._reconcile())
+        else:
+            await self.refresh_endpoints()
+        self._tasks["discovery"] = asyncio.create_task(self._poll_discovery())
+        for endpoint_id in self.endpoints:
+            self._start_endpoint(endpoint_id)
+
+    async def stop(self) -> None:
+        """Stop polling."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.save_snapshot()
@@ -0,0 +1,123 @@
+"""JSON decoding of Portainer responses."""
+from __future__ import annotations
+
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+
+from .const import API_CONTAINER_SNAPSHOT, API_ENDPOINT, API_ENDPOINTS
+from .helpers import get_api_template, optional_import
+
+_LOGGER = logging.getLogger(__name__)
+
+
+orjson = optional_import("orjson")
+msgspec = optional_import("msgspec")
+
+BACKENDS = ("auto", "msgspec", "orjson", "json")
+
+_TYPED_DECODERS: dict[str, Callable[[bytes], Any]] = {}
+
+if msgspec is not None and not TYPE_CHECKING:
+    # Only the fields the library uses, everything else is skipped while
+    # parsing. Field names match the API.
+    # pylint: disable=invalid-name
+
+    class _Container(msgspec.Struct):
+        Id: str
+        Names: List[str]
+        Image: str
+        ImageID: str
+        Created: int
+        Labels: Optional[dict]
+        State: str
+        Status: str
+
+    class _SnapshotRaw(msgspec.Struct):
+        Containers: Optional[List[_Container]] = None
+
+    class _Snapshot(msgspec.Struct):
+        DockerSnapshotRaw: Optional[_SnapshotRaw] = None
+
+    class _Endpoint(msgspec.Struct):
+        Id: int
+        Name: str
+        Type: int
+        URL: str
+        GroupId: int
+        PublicURL: str
+        Status: int
+        StatusMessage: Any
+        QueryDate: int
+        Snapshots: Optional[List[_Snapshot]] = None
+
+    def _typed(type_: Any) -> Callable[[bytes], Any]:
+        decoder = msgspec.json.Decoder(type_)
+
+        def decode(raw: bytes) -> Any:
+            return msgspec.to_builtins(decoder.decode(raw))
+
+        return decode
+
+    _TYPED_DECODERS = {
+        API_ENDPOINTS: _typed(List[_Endpoint]),
+        API_ENDPOINT: _typed(_Endpoint),
+        API_CONTAINER_SNAPSHOT: _typed(_Container),
+    }
+
+
+class PortainerJSONDecoder:
+    """Decodes JSON with the fastest available library.
+
+    ``backend`` is "auto" (msgspec, orjson or the standard library, whichever
+    is installed first), or one of "msgspec", "orjson" and "json". With
+    ``typed`` and msgspec installed, endpoints and containers are decoded
+    into structs holding only the fields the library uses, and returned as
+    dicts without the other fields.
+    """
+
+    def __init__(self, backend: str = "auto", typed: bool = False) -> None:
+        """Constructor method."""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+        if backend == "auto":
+            if msgspec is not None:
+                backend = "msgspec"
+            elif orjson is not None:
+                backend = "orjson"
+            else:
+                backend = "json"
+        if backend == "msgspec" and msgspec is None:
+            raise ValueError("The msgspec JSON backend is not installed")
+        if backend == "orjson" and orjson is None:
+            raise ValueError("The orjson JSON backend is not installed")
+        self.backend = backend
+        self.typed = typed and msgspec is not None
+        self._decode: Callable[[bytes], Any] = json.loads
+        if backend == "msgspec":
+            self._decode = msgspec.json.Decoder().decode
+        elif backend == "orjson":
+            self._decode = orjson.loads
+
+    def decode(self, raw: bytes, api: str | None = None) -> Any:
+        """Decode a response body, of the given API when known.
+
+        Raises:
+            JSONDecodeError: The body is not valid JSON, for every backend.
+        """
+        if self.typed and api is not None:
+            typed_decoder = _TYPED_DECODERS.get(get_api_template(api))
+            if typed_decoder is not None:
+                try:
+                    return typed_decoder(raw)
+                except msgspec.ValidationError as exp:
+                    # The API returned something unexpected, keep everything
+                    _LOGGER.debug("Typed decoding of %s failed: %s", api, exp)
+                except msgspec.DecodeError as exp:
+                    raise json.JSONDecodeError(str(exp), "", 0) from exp
+        if msgspec is not None and self.backend == "msgspec":
+            try:
+                return self._decode(raw)
+            except msgspec.DecodeError as exp:
+                raise json.JSONDecodeError(str(exp), "", 0) from exp
+        return self._decode(raw)
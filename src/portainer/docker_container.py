@@ -1,9 +1,11 @@
 """Class to interact with Portainer docker containers."""
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any
+import sys
+from typing import TYPE_CHECKING, Any, AsyncIterator, Collection
 
 from .const import (
+    API_CONTAINER_LOGS,
     API_CONTAINER_RESTART,
     API_CONTAINER_SNAPSHOT,
     API_CONTAINER_START,
@@ -11,39 +13,134 @@ from .const import (
     API_IMAGE_STATUS,
     API_RECREATE,
     API_STATS,
+    CONTENT_TYPE_MULTIPLEXED_STREAM,
+    CONTENT_TYPE_RAW_STREAM,
 )
 from .exceptions import PortainerException
+from .history import StatsHistory
+from .logs import DockerLogDemuxer, PortainerLogLine
+from .stats import ContainerStats
 
 if TYPE_CHECKING:
     from portainer import Portainer
 
+    from .endpoint import PortainerEndpoint
+
+
+def _compact_labels(
+    labels: dict[str, str] | None, whitelist: Collection[str] | None
+) -> dict[str, str] | None:
+    """Return the labels with interned strings, limited to the whitelist."""
+    if labels is None:
+        return None
+    return {
+        sys.intern(key): sys.intern(value)
+        for key, value in labels.items()
+        if whitelist is None or key in whitelist
+    }
+
 
 class PortainerDockerContainer:
-    """Portainer docker containers class."""
+    """Portainer docker containers class.
+
+    Instances are slotted and share the strings that repeat across
+    containers, such as images, states and labels, to keep large fleets
+    small in memory.
+    """
+
+    __slots__ = (
+        "_portainer",
+        "_endpoint_id",
+        "_endpoint",
+        "image_status",
+        "container_id",
+        "name",
+        "image",
+        "image_id",
+        "created",
+        "labels",
+        "state",
+        "status",
+        "stats",
+        "container_stats",
+        "stats_history",
+    )
 
     def __init__(
-        self, portainer: Portainer, endpoint_id: str, docker_container: dict
+        self,
+        portainer: Portainer,
+        endpoint_id: str,
+        docker_container: dict,
+        endpoint: PortainerEndpoint | None = None,
     ) -> None:
-        """Constructor method."""
+        """Constructor method.
+
+        Changes made by refresh() and recreate() are reported to the
+        listeners of ``endpoint``.
+        """
         self._portainer = portainer
         self._endpoint_id = endpoint_id
+        self._endpoint = endpoint
         self.image_status: dict[Any, Any] = {}
         self.container_id = ""
+        self.name = ""
+        self.image = ""
+        self.image_id = ""
+        self.created = 0
+        self.labels: dict[str, str] | None = None
+        self.state = ""
         self.status = ""
         self.stats: dict[Any, Any] = {}
+        self.container_stats: ContainerStats | None = None
+        self.stats_history: StatsHistory | None = None
         self.after_refresh(docker_container)
 
+    @property
+    def endpoint_id(self) -> str:
+        """Return the id of the endpoint running the container."""
+        return self._endpoint_id
+
     def after_refresh(self, docker_container: dict) -> None:
-        """Sets all variables."""
+        """Sets all variables.
+
+        Labels are limited to the ``label_whitelist`` of Portainer when set.
+        """
         self.container_id = docker_container["Id"]
         self.name = docker_container["Names"][0][1:]
-        self.image = docker_container["Image"]
-        self.image_id = docker_container["ImageID"]
+        self.image = sys.intern(docker_container["Image"])
+        self.image_id = sys.intern(docker_container["ImageID"])
         self.created = docker_container["Created"]
-        self.labels = docker_container["Labels"]
-        self.state = docker_container["State"]
+        self.labels = _compact_labels(
+            docker_container["Labels"], self._portainer.label_whitelist
+        )
+        self.state = sys.intern(docker_container["State"])
         self.status = docker_container["Status"]
 
+    def _identity(self) -> tuple[str, str, str, str]:
+        """Return the values whose change is reported to the endpoint."""
+        return (self.container_id, self.name, self.state, self.image_id)
+
+    def _report_change(self, previous: tuple[str, str, str, str]) -> None:
+        """Report a change of the container to its endpoint, if any."""
+        if self._endpoint is not None and previous != self._identity():
+            self._endpoint.container_changed(self, previous[1])
+
+    def as_dict(self) -> dict:
+        """Return the container in the format of the API.
+
+        Only the fields the library uses are included.
+        """
+        return {
+            "Id": self.container_id,
+            "Names": [f"/{self.name}"],
+            "Image": self.image,
+            "ImageID": self.image_id,
+            "Created": self.created,
+            "Labels": self.labels,
+            "State": self.state,
+            "Status": self.status,
+        }
+
     async def refresh(self) -> None:
         """Refreshes the properties."""
         api = API_CONTAINER_SNAPSHOT.format(
@@ -52,7 +149,9 @@ class PortainerDockerContainer:
         response = await self._portainer.get(api, None)
 
         if response["status_code"] == 200:
-            return self.after_refresh(response["body"])
+            previous = self._identity()
+            self.after_refresh(response["body"])
+            return self._report_change(previous)
 
         raise PortainerException(
             api,
@@ -79,8 +178,24 @@ class PortainerDockerContainer:
             response["body"]["details"],
         )
 
-    async def get_stats(self) -> dict:
-        """Request the stats of the container."""
+    def _set_stats(self, stats: dict, keep_raw: bool) -> None:
+        """Store a stats sample and its derived values."""
+        self.container_stats = ContainerStats(stats, self.container_stats)
+        self.stats = stats if keep_raw else {}
+        if self._portainer.stats_history_size:
+            if self.stats_history is None:
+                self.stats_history = StatsHistory(self._portainer.stats_history_size)
+            self.stats_history.record(self.container_stats)
+
+    async def get_stats(self, keep_raw: bool = True) -> dict:
+        """Request the stats of the container.
+
+        The derived values are stored in ``container_stats``, with
+        ``keep_raw`` False the raw response is not kept in ``stats``.
+
+        Raises:
+            PortainerException: The API didn't return the stats.
+        """
         api = API_STATS.format(
             environment_id=self._endpoint_id, container_id=self.container_id
         )
@@ -88,8 +203,8 @@ class PortainerDockerContainer:
         response = await self._portainer.get(api, None)
 
         if response["status_code"] == 200:
-            self.stats = response["body"]
-            return self.stats
+            self._set_stats(response["body"], keep_raw)
+            return dict(response["body"])
 
         raise PortainerException(
             api,
@@ -98,6 +213,94 @@ class PortainerDockerContainer:
             response["body"]["details"],
         )
 
+    async def stream_stats(
+        self, read_timeout: float | None = 30, keep_raw: bool = True
+    ) -> AsyncIterator[dict]:
+        """Stream the stats of the container, one sample at a time.
+
+        Keeps the stats request open and yields every sample Docker sends
+        (about one per second). Samples are read as they are consumed, so a
+        slow consumer throttles the connection instead of buffering.
+
+        Yields:
+            The stats samples, as returned by the API.
+        """
+        api = API_STATS.format(
+            environment_id=self._endpoint_id, container_id=self.container_id
+        )
+        async with self._portainer.stream(
+            api, {"stream": "true"}, read_timeout
+        ) as response:
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    stats = self._portainer.json_decoder.decode(line)
+                    self._set_stats(stats, keep_raw)
+                    yield stats
+            if buffer.strip():
+                stats = self._portainer.json_decoder.decode(buffer)
+                self._set_stats(stats, keep_raw)
+                yield stats
+
+    async def stream_logs(
+        self,
+        follow: bool = False,
+        since: float | None = None,
+        tail: int | None = None,
+        stdout: bool = True,
+        stderr: bool = True,
+        timestamps: bool = False,
+        read_timeout: float | None = None,
+    ) -> AsyncIterator[PortainerLogLine]:
+        """Stream the logs of the container, one line at a time.
+
+        ``since`` is a unix timestamp and ``tail`` the number of lines to
+        start with, all by default. With ``follow`` the stream stays open
+        for new lines. With ``timestamps`` each line carries the docker
+        timestamp. Lines are read as they are consumed, the logs are never
+        held in memory as a whole.
+
+        Yields:
+            The log lines, without their line break.
+        """
+        api = API_CONTAINER_LOGS.format(
+            environment_id=self._endpoint_id, container_id=self.container_id
+        )
+        params: dict[str, Any] = {
+            "stdout": int(stdout),
+            "stderr": int(stderr),
+            "follow": int(follow),
+            "timestamps": int(timestamps),
+            "tail": "all" if tail is None else tail,
+        }
+        if since is not None:
+            params["since"] = since
+        async with self._portainer.stream(api, params, read_timeout) as response:
+            content_type = response.headers.get("Content-Type", "").split(";")[0]
+            multiplexed = None
+            if content_type == CONTENT_TYPE_MULTIPLEXED_STREAM:
+                multiplexed = True
+            elif content_type == CONTENT_TYPE_RAW_STREAM:
+                multiplexed = False
+            demuxer = DockerLogDemuxer(multiplexed)
+            async for chunk in response.content.iter_any():
+                for stream, line in demuxer.feed(chunk):
+                    yield self._log_line(stream, line, timestamps)
+            for stream, line in demuxer.flush():
+                yield self._log_line(stream, line, timestamps)
+
+    def _log_line(self, stream: str, line: bytes, timestamps: bool) -> PortainerLogLine:
+        """Return a decoded log line."""
+        message = line.decode(errors="replace").rstrip("\r")
+        timestamp = None
+        if timestamps:
+            timestamp, _, message = message.partition(" ")
+        return PortainerLogLine(self, stream, message, timestamp)
+
     async def recreate(self, pull_image: bool = True) -> dict:
         """Recreate the container."""
         api = API_RECREATE.format(
@@ -107,8 +310,10 @@ class PortainerDockerContainer:
         response = await self._portainer.post(api, param)
 
         if response["status_code"] == 200:
+            previous = self._identity()
             self.container_id = response["body"]["Id"]
             self.status = response["body"]["State"]["Status"]
+            self._report_change(previous)
             return dict(response["body"])
         raise PortainerException(
             api,
@@ -1,40 +1,154 @@
 """Class to interact with Portainer endpoints."""
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Dict
+import asyncio
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict
 
-from .const import API_ENDPOINT
+from .bulk import PortainerBulkResult, check_image_status, run_bulk
+from .const import (
+    API_DOCKER_CONTAINERS,
+    API_DOCKER_EVENTS,
+    API_ENDPOINT,
+    DOCKER_EVENT_STATES,
+)
 from .docker_container import PortainerDockerContainer
-from .exceptions import PortainerException
+from .exceptions import (
+    PortainerException,
+    PortainerInvalidCredentialsException,
+    PortainerNotLoggedInException,
+)
+from .history import aggregate_stats
 
 if TYPE_CHECKING:
     from portainer import Portainer
 
+_LOGGER = logging.getLogger(__name__)
+
+
+def _resume_since(event: dict, since: str | None) -> str | None:
+    """Return the docker ``since`` value to resume the events after an event."""
+    time_nano = event.get("timeNano")
+    if isinstance(time_nano, int):
+        # Docker includes events at ``since``, resume one nanosecond later
+        seconds, nanoseconds = divmod(time_nano + 1, 1_000_000_000)
+        return f"{seconds}.{nanoseconds:09d}"
+    if "time" in event:
+        return str(event["time"])
+    return since
+
+
+class PortainerContainerDiff:
+    """Containers added, removed or changed by a refresh of an endpoint.
+
+    Containers are matched on their id, a recreated container is reported as
+    removed and added. A container is changed when its state or image
+    changed.
+    """
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        self.added: list[PortainerDockerContainer] = []
+        self.removed: list[PortainerDockerContainer] = []
+        self.changed: list[PortainerDockerContainer] = []
+
+    def __bool__(self) -> bool:
+        """Return True when anything changed."""
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return (
+            f"<PortainerContainerDiff added={len(self.added)} "
+            f"removed={len(self.removed)} changed={len(self.changed)}>"
+        )
+
 
 class PortainerEndpoint:
     """Portainer endpoints class."""
 
-    def __init__(self, portainer: Portainer, endpoint: dict) -> None:
-        """Constructor method."""
+    def __init__(
+        self, portainer: Portainer, endpoint: dict, lazy: bool = False
+    ) -> None:
+        """Constructor method.
+
+        With ``lazy`` the container objects are only created on the first
+        access to ``docker_container``.
+        """
         self._portainer = portainer
-        self.docker_container: Dict[str, PortainerDockerContainer] = {}
+        self._docker_container: Dict[str, PortainerDockerContainer] = {}
+        self._pending_containers: list[dict] | None = None
+        # True once the containers were read or built
+        self._loaded = not lazy
+        self._listeners: list[
+            Callable[[PortainerEndpoint, PortainerContainerDiff], None]
+        ] = []
+        # True while the containers come from a persisted snapshot
+        self.stale = False
         self.after_refresh(endpoint)
 
-    async def refresh(self) -> None:
-        """Refresh properties."""
+    @property
+    def docker_container(self) -> Dict[str, PortainerDockerContainer]:
+        """Return the containers by name."""
+        self._load_pending_containers()
+        return self._docker_container
+
+    @docker_container.setter
+    def docker_container(self, value: Dict[str, PortainerDockerContainer]) -> None:
+        """Set the containers by name."""
+        self._pending_containers = None
+        self._loaded = True
+        self._docker_container = value
+
+    def _load_pending_containers(self) -> None:
+        """Create the container objects of a lazy endpoint."""
+        self._loaded = True
+        if self._pending_containers is not None:
+            containers = self._pending_containers
+            self._pending_containers = None
+            self.generate_containers(containers)
+
+    def add_listener(
+        self, listener: Callable[[PortainerEndpoint, PortainerContainerDiff], None]
+    ) -> Callable[[], None]:
+        """Call the listener with the diff of every refresh that changed containers.
+
+        Returns a function that removes the listener.
+        """
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def _notify(self, diff: PortainerContainerDiff) -> None:
+        """Call the listeners when anything changed."""
+        if not diff:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(self, diff)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in endpoint listener %s", listener)
+
+    async def refresh(self) -> PortainerContainerDiff:
+        """Refresh properties and return the container changes."""
         api = API_ENDPOINT.format(environment_id=self.endpoint_id)
         response = await self._portainer.get(api, None)
         if response["status_code"] == 200:
-            self.after_refresh(response["body"])
-        else:
-            raise PortainerException(
-                api,
-                response["status_code"],
-                response["body"]["message"],
-                response["body"]["details"],
-            )
+            return self.after_refresh(response["body"])
+        raise PortainerException(
+            api,
+            response["status_code"],
+            response["body"]["message"],
+            response["body"]["details"],
+        )
 
-    def after_refresh(self, endpoint: dict) -> None:
+    def after_refresh(self, endpoint: dict) -> PortainerContainerDiff:
         """Set variables from a refresh."""
         self.endpoint_id = endpoint["Id"]
         self.name = endpoint["Name"]
@@ -45,20 +159,271 @@ class PortainerEndpoint:
         self.status = endpoint["Status"]
         self.status_message = endpoint["StatusMessage"]
         self.time = endpoint["QueryDate"]
-        self.generate_containers(
-            endpoint["Snapshots"][0]["DockerSnapshotRaw"]["Containers"]
-        )
+        snapshots = endpoint.get("Snapshots")
+        if not snapshots or not snapshots[0].get("DockerSnapshotRaw"):
+            # Snapshots excluded or not taken yet, keep the known containers
+            return PortainerContainerDiff()
+        containers = snapshots[0]["DockerSnapshotRaw"]["Containers"] or []
+        self.stale = False
+        if not self._loaded:
+            # Not accessed yet, build the objects on first access
+            self._pending_containers = containers
+            return PortainerContainerDiff()
+        return self.generate_containers(containers)
+
+    def as_dict(self) -> dict:
+        """Return the endpoint and its containers in the format of the API.
 
-    def generate_containers(self, containers: dict) -> None:
-        """Create or update container objects."""
+        Only the fields the library uses are included.
+        """
+        if self._pending_containers is not None:
+            containers = self._pending_containers
+        else:
+            containers = [
+                container.as_dict() for container in self._docker_container.values()
+            ]
+        return {
+            "Id": self.endpoint_id,
+            "Name": self.name,
+            "Type": self.type,
+            "URL": self.url,
+            "GroupId": self.group_id,
+            "PublicURL": self.public_url,
+            "Status": self.status,
+            "StatusMessage": self.status_message,
+            "QueryDate": self.time,
+            "Snapshots": [{"DockerSnapshotRaw": {"Containers": containers}}],
+        }
+
+    def generate_containers(self, containers: list[dict]) -> PortainerContainerDiff:
+        """Create, update or remove container objects and return the changes."""
+        diff = self._update_containers(containers)
+        self._notify(diff)
+        return diff
+
+    def _update_containers(
+        self, containers: list[dict], prune: bool = True
+    ) -> PortainerContainerDiff:
+        """Create, update and, with prune, remove container objects."""
+        diff = PortainerContainerDiff()
+        existing = {
+            container.container_id: container
+            for container in self._docker_container.values()
+        }
+        docker_container: Dict[str, PortainerDockerContainer] = (
+            {} if prune else dict(self._docker_container)
+        )
         for container in containers:
-            if container["Names"][0][1:] in self.docker_container:
-                self.docker_container[container["Names"][0][1:]].after_refresh(
-                    container
+            docker = existing.pop(container["Id"], None)
+            if docker is None:
+                docker = PortainerDockerContainer(
+                    self._portainer, self.endpoint_id, container, self
                 )
+                diff.added.append(docker)
             else:
-                self.docker_container[
-                    container["Names"][0][1:]
-                ] = PortainerDockerContainer(
-                    self._portainer, self.endpoint_id, container
-                )
+                previous = (docker.name, docker.state, docker.image_id)
+                docker.after_refresh(container)
+                if previous != (docker.name, docker.state, docker.image_id):
+                    diff.changed.append(docker)
+                if not prune and previous[0] != docker.name:
+                    docker_container.pop(previous[0], None)
+            docker_container[docker.name] = docker
+        if prune:
+            diff.removed.extend(existing.values())
+        self._docker_container = docker_container
+        return diff
+
+    def container_changed(
+        self, container: PortainerDockerContainer, previous_name: str
+    ) -> None:
+        """Apply a change made by a container itself, e.g. by its refresh().
+
+        The listeners get the container as changed.
+        """
+        if (
+            previous_name != container.name
+            and self._docker_container.get(previous_name) is container
+        ):
+            del self._docker_container[previous_name]
+            self._docker_container[container.name] = container
+        diff = PortainerContainerDiff()
+        diff.changed.append(container)
+        self._notify(diff)
+
+    async def get_live_containers(
+        self, filters: dict[str, list[str]] | None = None
+    ) -> list[dict]:
+        """Request the current containers from docker instead of the snapshot.
+
+        ``filters`` are docker container filters, e.g. {"label": ["a=b"]}.
+
+        Raises:
+            PortainerException: Docker didn't return the containers.
+        """
+        api = API_DOCKER_CONTAINERS.format(environment_id=self.endpoint_id)
+        params: dict[str, str | int] = {"all": 1}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        response = await self._portainer.get(api, params)
+        if response["status_code"] == 200:
+            return list(response["body"])
+        body = response["body"] if isinstance(response["body"], dict) else {}
+        raise PortainerException(
+            api, response["status_code"], body.get("message"), body.get("details")
+        )
+
+    async def refresh_containers(
+        self,
+        label: list[str] | None = None,
+        status: list[str] | None = None,
+        name: list[str] | None = None,
+        ancestor: list[str] | None = None,
+        filters: dict[str, list[str]] | None = None,
+    ) -> PortainerContainerDiff:
+        """Refresh the containers from docker's live container list.
+
+        One request updates every container matching the docker filters
+        (e.g. label=["app=web"], status=["running"]) instead of one snapshot
+        request per container. Without filters containers that no longer
+        exist are removed, with filters only matching containers are added
+        or updated.
+        """
+        docker_filters = dict(filters or {})
+        for key, values in (
+            ("label", label),
+            ("status", status),
+            ("name", name),
+            ("ancestor", ancestor),
+        ):
+            if values:
+                docker_filters[key] = list(values)
+        containers = await self.get_live_containers(docker_filters)
+        self._load_pending_containers()
+        diff = self._update_containers(containers, prune=not docker_filters)
+        self._notify(diff)
+        return diff
+
+    async def watch_events(
+        self, reconnect_delay: float = 1, max_reconnect_delay: float = 60
+    ) -> AsyncIterator[dict]:
+        """Follow the docker container events of the endpoint.
+
+        Every event is applied to ``docker_container`` (and passed to the
+        listeners) before it is yielded. When the stream breaks or can't be
+        opened, e.g. while an edge agent is offline, it reconnects with
+        backoff, replays the missed events and resyncs the containers with
+        the live container list.
+
+        Yields:
+            The docker events, as returned by the API.
+
+        Raises:
+            PortainerNotLoggedInException: Not logged in.
+            PortainerInvalidCredentialsException: The session can't be renewed.
+        """
+        api = API_DOCKER_EVENTS.format(environment_id=self.endpoint_id)
+        filters = json.dumps({"type": ["container"]})
+        since: str | None = None
+        delay = reconnect_delay
+        while True:
+            params: dict[str, str] = {"filters": filters}
+            if since is not None:
+                params["since"] = since
+            try:
+                async with self._portainer.stream(api, params) as response:
+                    delay = reconnect_delay
+                    if since is not None:
+                        self.generate_containers(await self.get_live_containers())
+                    buffer = b""
+                    async for chunk in response.content.iter_any():
+                        buffer += chunk
+                        *lines, buffer = buffer.split(b"\n")
+                        for line in lines:
+                            if not line.strip():
+                                continue
+                            event = self._portainer.json_decoder.decode(line)
+                            since = _resume_since(event, since)
+                            await self._apply_event(event)
+                            yield event
+            except (
+                PortainerNotLoggedInException,
+                PortainerInvalidCredentialsException,
+            ):
+                raise
+            except (PortainerException, json.JSONDecodeError) as exp:
+                # Broken connection, error status, open circuit or bad event
+                _LOGGER.debug("Events of endpoint %s broke: %s", self.endpoint_id, exp)
+            if since is None:
+                since = str(int(time.time()))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_reconnect_delay)
+
+    async def _apply_event(self, event: dict) -> PortainerContainerDiff:
+        """Apply a docker container event to the containers."""
+        action = event.get("Action", event.get("status", "")).split(":")[0]
+        container_id = (event.get("Actor") or {}).get("ID", event.get("id"))
+        if action not in DOCKER_EVENT_STATES or not container_id:
+            return PortainerContainerDiff()
+        containers = self.docker_container
+        docker = next(
+            (
+                container
+                for container in containers.values()
+                if container.container_id == container_id
+            ),
+            None,
+        )
+        state = DOCKER_EVENT_STATES[action]
+        diff = PortainerContainerDiff()
+        if state == "removed":
+            if docker is not None:
+                del containers[docker.name]
+                diff.removed.append(docker)
+        elif state is None or docker is None:
+            # New or renamed container, look up its current details
+            diff = self._update_containers(
+                await self.get_live_containers({"id": [container_id]}), prune=False
+            )
+        elif docker.state != state:
+            docker.state = state
+            diff.changed.append(docker)
+        self._notify(diff)
+        return diff
+
+    async def bulk_container_action(
+        self,
+        action: str | Callable[..., Awaitable[Any]],
+        container_filter: Callable[[PortainerDockerContainer], bool] | None = None,
+        limit: int = 10,
+        **kwargs: Any,
+    ) -> list[PortainerBulkResult]:
+        """Run an action on the (filtered) containers of this endpoint."""
+        containers = [
+            container
+            for container in self.docker_container.values()
+            if container_filter is None or container_filter(container)
+        ]
+        return await run_bulk(
+            containers, action, limit=limit, order_by_endpoint=False, **kwargs
+        )
+
+    async def check_image_updates(
+        self,
+        container_filter: Callable[[PortainerDockerContainer], bool] | None = None,
+        limit: int = 5,
+    ) -> list[PortainerBulkResult]:
+        """Request the image status of the (filtered) containers, once per image."""
+        containers = [
+            container
+            for container in self.docker_container.values()
+            if container_filter is None or container_filter(container)
+        ]
+        return await check_image_status(
+            containers, self._portainer.image_status_cache, limit
+        )
+
+    def aggregate_stats(
+        self, metric: str, func: str = "mean", window: float | None = None
+    ) -> float | None:
+        """Return an aggregate of a stats metric over the container histories."""
+        return aggregate_stats(self.docker_container.values(), metric, func, window)
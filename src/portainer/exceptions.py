@@ -50,3 +50,17 @@ class PortainerRequestException(PortainerException):
         if hasattr(exception.args[0], "reason"):
             ex_reason = exception.args[0].reason
         super().__init__(None, -1, f"{ex_class} = {ex_reason}")
+
+
+class PortainerCircuitOpenException(PortainerException):
+    """Environment unavailable exception."""
+
+    def __init__(self, environment_id: int) -> None:
+        """Constructor method."""
+        super().__init__(
+            None,
+            -1,
+            f"Environment {environment_id} is unavailable, not sending requests.",
+            "",
+        )
+        self.environment_id = environment_id
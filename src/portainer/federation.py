@@ -0,0 +1,183 @@
+"""Queries across multiple Portainer instances."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Generic, Mapping, TypeVar
+
+from .docker_container import PortainerDockerContainer
+from .endpoint import PortainerEndpoint
+from .stack import PortainerStack
+
+if TYPE_CHECKING:
+    from portainer import Portainer
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+GLOBAL_ID_SEPARATOR = ":"
+
+
+def global_id(instance: str, *ids: Any) -> str:
+    """Return the federation wide id of an object of an instance.
+
+    E.g. "eu:3" for endpoint 3 of instance "eu" and "eu:3:<container id>"
+    for a container of that endpoint.
+    """
+    return GLOBAL_ID_SEPARATOR.join([instance, *(str(value) for value in ids)])
+
+
+def split_global_id(value: str) -> tuple[str, ...]:
+    """Return the instance name and the ids of a federation wide id."""
+    return tuple(value.split(GLOBAL_ID_SEPARATOR))
+
+
+class PortainerFederatedResult(Generic[_T]):
+    """Merged result of a query on all instances.
+
+    ``items`` holds the merged objects by global id, ``errors`` the
+    exception of every instance that failed or timed out.
+    """
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        self.items: dict[str, _T] = {}
+        self.errors: dict[str, BaseException] = {}
+
+    @property
+    def complete(self) -> bool:
+        """Return True when all instances answered."""
+        return not self.errors
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return (
+            f"<PortainerFederatedResult items={len(self.items)} "
+            f"failed={sorted(self.errors)}>"
+        )
+
+
+class PortainerFederation:
+    """Runs queries on multiple Portainer instances in parallel.
+
+    ``instances`` maps a unique name, used in the global ids, to each
+    Portainer. Every query runs on all instances at the same time, bounded by
+    ``timeout`` seconds per instance, so a fleet-wide query takes as long as
+    the slowest instance. Instances that fail don't fail the query, their
+    errors are returned with the results of the others.
+    """
+
+    def __init__(self, instances: Mapping[str, Portainer], timeout: float = 30) -> None:
+        """Constructor method."""
+        for name in instances:
+            if not name or GLOBAL_ID_SEPARATOR in name:
+                raise ValueError(f"Invalid instance name: {name!r}")
+        self.instances = dict(instances)
+        self.timeout = timeout
+
+    async def __aenter__(self) -> PortainerFederation:
+        """Enter the context."""
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Close all instances when leaving the context."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Close all instances."""
+        await asyncio.gather(
+            *(portainer.close() for portainer in self.instances.values())
+        )
+
+    async def fan_out(
+        self,
+        query: Callable[[Portainer], Awaitable[_T]],
+        timeout: float | None = None,
+    ) -> tuple[dict[str, _T], dict[str, BaseException]]:
+        """Run a query on all instances in parallel.
+
+        Returns the results and the errors by instance name.
+
+        Raises:
+            CancelledError: A query was cancelled.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        names = list(self.instances)
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(query(self.instances[name]), timeout) for name in names),
+            return_exceptions=True,
+        )
+        results: dict[str, _T] = {}
+        errors: dict[str, BaseException] = {}
+        for name, outcome in zip(names, outcomes, strict=True):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise asyncio.CancelledError() from outcome
+            if isinstance(outcome, BaseException):
+                _LOGGER.warning("Portainer instance %s failed: %r", name, outcome)
+                errors[name] = outcome
+            else:
+                results[name] = outcome
+        return results, errors
+
+    async def login(self, timeout: float | None = None) -> dict[str, BaseException]:
+        """Log into all instances, return the errors by instance name."""
+        _, errors = await self.fan_out(lambda portainer: portainer.login(), timeout)
+        return errors
+
+    async def get_endpoints(
+        self, timeout: float | None = None, **kwargs: Any
+    ) -> PortainerFederatedResult[PortainerEndpoint]:
+        """Get the endpoints of all instances, by "instance:endpoint_id".
+
+        ``kwargs`` are passed to Portainer.get_endpoints().
+        """
+
+        async def query(portainer: Portainer) -> list[PortainerEndpoint]:
+            return await portainer.get_endpoints(**kwargs) or []
+
+        results, errors = await self.fan_out(query, timeout)
+        merged: PortainerFederatedResult[PortainerEndpoint] = PortainerFederatedResult()
+        merged.errors = errors
+        for name, endpoints in results.items():
+            for endpoint in endpoints:
+                merged.items[global_id(name, endpoint.endpoint_id)] = endpoint
+        return merged
+
+    async def get_containers(
+        self,
+        container_filter: Callable[[PortainerDockerContainer], bool] | None = None,
+        timeout: float | None = None,
+        **kwargs: Any,
+    ) -> PortainerFederatedResult[PortainerDockerContainer]:
+        """Get the (filtered) containers of all instances.
+
+        Containers are keyed by "instance:endpoint_id:container_id" and come
+        from the endpoint snapshots. ``kwargs`` are passed to
+        Portainer.get_endpoints().
+        """
+        endpoints = await self.get_endpoints(timeout, **kwargs)
+        merged: PortainerFederatedResult[
+            PortainerDockerContainer
+        ] = PortainerFederatedResult()
+        merged.errors = endpoints.errors
+        for endpoint_global_id, endpoint in endpoints.items.items():
+            for container in endpoint.docker_container.values():
+                if container_filter is None or container_filter(container):
+                    key = global_id(endpoint_global_id, container.container_id)
+                    merged.items[key] = container
+        return merged
+
+    async def get_stacks(
+        self, timeout: float | None = None
+    ) -> PortainerFederatedResult[PortainerStack]:
+        """Get the stacks of all instances, by "instance:stack_id"."""
+        results, errors = await self.fan_out(
+            lambda portainer: portainer.get_stacks(), timeout
+        )
+        merged: PortainerFederatedResult[PortainerStack] = PortainerFederatedResult()
+        merged.errors = errors
+        for name, stacks in results.items():
+            for stack in stacks:
+                merged.items[global_id(name, stack.stack_id)] = stack
+        return merged
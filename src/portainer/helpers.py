@@ -0,0 +1,66 @@
+"""Library helpers."""
+from __future__ import annotations
+
+import importlib
+import re
+from typing import Any
+
+from . import const
+
+_ENVIRONMENT_ID = re.compile(r"^(?:endpoints|docker)/(\d+)(?:[/?]|$)")
+_ENVIRONMENT_ID_PARAM = re.compile(r"[?&]endpointId=(\d+)(?:&|$)")
+
+
+def get_environment_id(api: str) -> int | None:
+    """Return the environment (endpoint) id an API path belongs to.
+
+    The id is taken from the path or from the endpointId query parameter.
+    """
+    match = _ENVIRONMENT_ID.match(api) or _ENVIRONMENT_ID_PARAM.search(api)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+_API_CONSTANTS = [
+    template
+    for name, template in vars(const).items()
+    if name.startswith("API_") and isinstance(template, str)
+]
+_API_STATIC = {template for template in _API_CONSTANTS if "{" not in template}
+_API_TEMPLATES = [
+    (
+        re.compile(
+            re.escape(template)
+            .replace(r"\{environment_id\}", r"\d+")
+            .replace(r"\{container_id\}", "[^/]+")
+            .replace(r"\{stack_id\}", r"\d+")
+            + "$"
+        ),
+        template,
+    )
+    for template in _API_CONSTANTS
+    if "{" in template
+]
+
+
+def get_api_template(api: str) -> str:
+    """Return the API constant an API path was formatted from.
+
+    Paths that don't match a known API are returned without query string.
+    """
+    path = api.split("?")[0]
+    if path in _API_STATIC:
+        return path
+    for pattern, template in _API_TEMPLATES:
+        if pattern.match(path):
+            return template
+    return path
+
+
+def optional_import(name: str) -> Any:
+    """Return an optional module, None when it is not installed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
@@ -0,0 +1,259 @@
+"""Fixed-size history of container stats."""
+from __future__ import annotations
+
+import math
+import time
+from array import array
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
+
+from .helpers import optional_import
+from .stats import ContainerStats
+
+if TYPE_CHECKING:
+    from .docker_container import PortainerDockerContainer
+
+numpy = optional_import("numpy")
+
+HISTORY_BACKENDS = ("auto", "numpy", "array")
+
+# Metrics of ContainerStats kept in the history
+HISTORY_METRICS = (
+    "cpu_percent",
+    "memory_usage",
+    "memory_percent",
+    "network_rx",
+    "network_tx",
+    "block_read",
+    "block_write",
+    "pids",
+)
+
+AGGREGATES = ("mean", "min", "max", "sum", "last")
+
+
+def _percentile(values: Sequence[float], percentile: float) -> float:
+    """Return a percentile with linear interpolation, like numpy."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percentile / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _aggregate(values: Any, func: str, vectorized: bool) -> float:
+    """Apply an aggregate to a non-empty numpy array or sequence."""
+    if func == "last":
+        return float(values[-1])
+    if func.startswith("p"):
+        percentile = float(func[1:])
+        if vectorized:
+            return float(numpy.percentile(values, percentile))
+        return _percentile(values, percentile)
+    if vectorized:
+        return float(getattr(values, func)())
+    if func == "mean":
+        return math.fsum(values) / len(values)
+    if func == "sum":
+        return math.fsum(values)
+    return float(min(values) if func == "min" else max(values))
+
+
+def _check_func(func: str) -> None:
+    """Raise ValueError for an unknown aggregate."""
+    if func in AGGREGATES:
+        return
+    if func.startswith("p"):
+        try:
+            if 0 <= float(func[1:]) <= 100:
+                return
+        except ValueError:
+            pass
+    raise ValueError(f"Unknown aggregate: {func}")
+
+
+class StatsHistory:
+    """Ring buffer of the last ``capacity`` stats samples of a container.
+
+    Every metric is stored in its own array of floats, with NumPy when it is
+    installed (``backend`` "auto" or "numpy") or the standard ``array``
+    module, so a sample costs 8 bytes per metric. Aggregates are computed
+    over the samples of the last ``window`` seconds, or all samples.
+    Aggregates are "mean", "min", "max", "sum", "last" or a percentile such
+    as "p99".
+    """
+
+    __slots__ = ("capacity", "vectorized", "_timestamps", "_metrics", "_next", "_count")
+
+    def __init__(self, capacity: int = 720, backend: str = "auto") -> None:
+        """Constructor method."""
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if backend not in HISTORY_BACKENDS:
+            raise ValueError(f"Unknown history backend: {backend}")
+        if backend == "numpy" and numpy is None:
+            raise ValueError("NumPy is not installed")
+        self.capacity = capacity
+        self.vectorized = backend != "array" and numpy is not None
+        self._timestamps = self._new_array()
+        self._metrics = {metric: self._new_array() for metric in HISTORY_METRICS}
+        self._next = 0
+        self._count = 0
+
+    def _new_array(self) -> Any:
+        """Return a zeroed float array of the capacity."""
+        if self.vectorized:
+            return numpy.zeros(self.capacity)
+        return array("d", bytes(8 * self.capacity))
+
+    def __len__(self) -> int:
+        """Return the number of samples."""
+        return self._count
+
+    def record(self, stats: ContainerStats) -> None:
+        """Add a sample, replacing the oldest one when full."""
+        index = self._next
+        self._timestamps[index] = stats.timestamp
+        for metric, values in self._metrics.items():
+            values[index] = getattr(stats, metric)
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _ordered(self, values: Any) -> Any:
+        """Return the samples of an array from oldest to newest."""
+        if self._count < self.capacity:
+            return values[: self._count]
+        if self.vectorized:
+            return numpy.concatenate((values[self._next :], values[: self._next]))
+        return values[self._next :] + values[: self._next]
+
+    def _start(self, window: float | None, now: float | None) -> int:
+        """Return the position of the first ordered sample within the window."""
+        if window is None:
+            return 0
+        since = (time.time() if now is None else now) - window
+        timestamps = self._ordered(self._timestamps)
+        if self.vectorized:
+            return int(numpy.searchsorted(timestamps, since))
+        low, high = 0, len(timestamps)
+        while low < high:
+            middle = (low + high) // 2
+            if timestamps[middle] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def timestamps(self, window: float | None = None, now: float | None = None) -> Any:
+        """Return the sample times from oldest to newest."""
+        return self._ordered(self._timestamps)[self._start(window, now) :]
+
+    def values(
+        self, metric: str, window: float | None = None, now: float | None = None
+    ) -> Any:
+        """Return the values of a metric from oldest to newest."""
+        if metric not in self._metrics:
+            raise ValueError(f"Unknown metric: {metric}")
+        return self._ordered(self._metrics[metric])[self._start(window, now) :]
+
+    def aggregate(
+        self,
+        metric: str,
+        func: str = "mean",
+        window: float | None = None,
+        now: float | None = None,
+    ) -> float | None:
+        """Return an aggregate of a metric, None without samples."""
+        _check_func(func)
+        values = self.values(metric, window, now)
+        if not len(values):
+            return None
+        return _aggregate(values, func, self.vectorized)
+
+    def rate(
+        self, metric: str, window: float | None = None, now: float | None = None
+    ) -> float | None:
+        """Return the average per second increase of a counter.
+
+        Counter resets, e.g. after a restart, are skipped. None with fewer
+        than two samples.
+        """
+        values = self.values(metric, window, now)
+        timestamps = self.timestamps(window, now)
+        if len(values) < 2 or timestamps[-1] <= timestamps[0]:
+            return None
+        elapsed = timestamps[-1] - timestamps[0]
+        if self.vectorized:
+            deltas = numpy.diff(values)
+            return float(deltas[deltas > 0].sum() / elapsed)
+        increase = math.fsum(
+            max(current - previous, 0.0)
+            for previous, current in zip(values, values[1:], strict=False)
+        )
+        return float(increase / elapsed)
+
+    def downsample(
+        self,
+        metric: str,
+        interval: float,
+        func: str = "mean",
+        window: float | None = None,
+        now: float | None = None,
+    ) -> list[tuple[float, float]]:
+        """Return (bucket start, aggregate) for buckets of ``interval`` seconds."""
+        _check_func(func)
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        values = self.values(metric, window, now)
+        timestamps = self.timestamps(window, now)
+        if not len(values):
+            return []
+        if self.vectorized:
+            buckets = numpy.floor(timestamps / interval) * interval
+            starts, first = numpy.unique(buckets, return_index=True)
+            ends = list(first[1:]) + [len(values)]
+            return [
+                (float(start), _aggregate(values[begin:end], func, True))
+                for start, begin, end in zip(starts, first, ends, strict=True)
+            ]
+        result: list[tuple[float, float]] = []
+        begin = 0
+        for position in range(1, len(values) + 1):
+            bucket = math.floor(timestamps[begin] / interval) * interval
+            if (
+                position == len(values)
+                or math.floor(timestamps[position] / interval) * interval != bucket
+            ):
+                result.append((bucket, _aggregate(values[begin:position], func, False)))
+                begin = position
+        return result
+
+
+def aggregate_stats(
+    containers: Iterable[PortainerDockerContainer],
+    metric: str,
+    func: str = "mean",
+    window: float | None = None,
+    now: float | None = None,
+) -> float | None:
+    """Return an aggregate of a metric over the histories of many containers.
+
+    The samples of all containers are aggregated together, e.g. the p99
+    memory usage of every sample of an endpoint. Containers without a
+    history are skipped. None without samples.
+    """
+    _check_func(func)
+    histories = [
+        container.stats_history
+        for container in containers
+        if container.stats_history is not None
+    ]
+    samples = [history.values(metric, window, now) for history in histories]
+    samples = [values for values in samples if len(values)]
+    if not samples:
+        return None
+    if all(history.vectorized for history in histories):
+        return _aggregate(numpy.concatenate(samples), func, True)
+    merged: list[float] = []
+    for values in samples:
+        merged.extend(values)
+    return _aggregate(merged, func, False)
@@ -0,0 +1,135 @@
+"""Fleet-wide index of docker containers."""
+from __future__ import annotations
+
+from typing import Any, Callable, Hashable, Mapping
+
+from .docker_container import PortainerDockerContainer
+from .endpoint import PortainerContainerDiff, PortainerEndpoint
+
+
+class PortainerContainerIndex:
+    """Secondary indexes on the containers of many endpoints.
+
+    Containers are indexed on endpoint, container id, image, image id, state,
+    label key and label key/value. The index follows the changes of the
+    endpoints it was given through their listeners, including containers
+    changed by their own refresh() or recreate(), so queries never scan all
+    containers.
+    """
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        # The indexed values of every container, to unindex after changes
+        self._entries: dict[PortainerDockerContainer, list[tuple[str, Hashable]]] = {}
+        self._indexes: dict[str, dict[Hashable, set[PortainerDockerContainer]]] = {
+            "endpoint_id": {},
+            "container_id": {},
+            "image": {},
+            "image_id": {},
+            "state": {},
+            "label": {},
+            "label_key": {},
+        }
+        self._endpoints: dict[Any, Callable[[], None]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of indexed containers."""
+        return len(self._entries)
+
+    def add_endpoint(self, endpoint: PortainerEndpoint) -> None:
+        """Index the containers of an endpoint and follow its changes."""
+        if endpoint.endpoint_id in self._endpoints:
+            return
+        self._endpoints[endpoint.endpoint_id] = endpoint.add_listener(self._update)
+        for container in endpoint.docker_container.values():
+            self._index(container)
+
+    def remove_endpoint(self, endpoint: PortainerEndpoint) -> None:
+        """Stop following an endpoint and drop its containers."""
+        remove_listener = self._endpoints.pop(endpoint.endpoint_id, None)
+        if remove_listener is not None:
+            remove_listener()
+        for container in list(
+            self._indexes["endpoint_id"].get(endpoint.endpoint_id, ())
+        ):
+            self._unindex(container)
+
+    def _update(
+        self, endpoint: PortainerEndpoint, diff: PortainerContainerDiff
+    ) -> None:
+        """Apply the container changes of an endpoint."""
+        for container in diff.removed:
+            self._unindex(container)
+        for container in diff.added + diff.changed:
+            self._index(container)
+
+    @staticmethod
+    def _values(container: PortainerDockerContainer) -> list[tuple[str, Hashable]]:
+        """Return the (index, value) pairs of a container."""
+        values: list[tuple[str, Hashable]] = [
+            ("endpoint_id", container.endpoint_id),
+            ("container_id", container.container_id),
+            ("image", container.image),
+            ("image_id", container.image_id),
+            ("state", container.state),
+        ]
+        for key, value in (container.labels or {}).items():
+            values.append(("label_key", key))
+            values.append(("label", (key, value)))
+        return values
+
+    def _index(self, container: PortainerDockerContainer) -> None:
+        """Add or update a container."""
+        self._unindex(container)
+        values = self._values(container)
+        self._entries[container] = values
+        for index, value in values:
+            self._indexes[index].setdefault(value, set()).add(container)
+
+    def _unindex(self, container: PortainerDockerContainer) -> None:
+        """Remove a container with the values it was indexed with."""
+        values = self._entries.pop(container, None)
+        for index, value in values or ():
+            containers = self._indexes[index][value]
+            containers.discard(container)
+            if not containers:
+                del self._indexes[index][value]
+
+    def query(
+        self,
+        state: str | None = None,
+        image: str | None = None,
+        image_id: str | None = None,
+        labels: Mapping[str, str | None] | None = None,
+        endpoint_id: Any = None,
+        container_id: str | None = None,
+    ) -> list[PortainerDockerContainer]:
+        """Return the containers matching all given filters.
+
+        ``labels`` maps label keys to their value, or to None to only require
+        the key. Without filters all containers are returned.
+        """
+        candidates: list[set[PortainerDockerContainer]] = []
+        for index, value in (
+            ("state", state),
+            ("image", image),
+            ("image_id", image_id),
+            ("endpoint_id", endpoint_id),
+            ("container_id", container_id),
+        ):
+            if value is not None:
+                candidates.append(self._indexes[index].get(value, set()))
+        for key, label_value in (labels or {}).items():
+            if label_value is None:
+                candidates.append(self._indexes["label_key"].get(key, set()))
+            else:
+                candidates.append(self._indexes["label"].get((key, label_value), set()))
+        if not candidates:
+            return list(self._entries)
+        sets = sorted(candidates, key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            if not result:
+                break
+            result.intersection_update(other)
+        return list(result)
@@ -0,0 +1,162 @@
+"""Streaming of docker container logs."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable, Iterator
+
+from .const import DOCKER_LOG_STREAMS
+
+if TYPE_CHECKING:
+    from .docker_container import PortainerDockerContainer
+
+_LOGGER = logging.getLogger(__name__)
+
+_HEADER_SIZE = 8
+_STDOUT = 1
+
+
+class PortainerLogLine:
+    """One line of the logs of a container."""
+
+    __slots__ = ("container", "stream", "message", "timestamp")
+
+    def __init__(
+        self,
+        container: PortainerDockerContainer,
+        stream: str,
+        message: str,
+        timestamp: str | None = None,
+    ) -> None:
+        """Constructor method."""
+        self.container = container
+        self.stream = stream
+        self.message = message
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"<PortainerLogLine {self.container.name} {self.stream}: {self.message}>"
+
+
+class DockerLogDemuxer:
+    """Splits a docker log stream into lines per output stream, incrementally.
+
+    Non-TTY containers send frames of an 8 byte header (stream type, three
+    zero bytes and the big-endian payload size) and the payload, TTY
+    containers send the raw output. With ``multiplexed`` None the format is
+    detected from the first bytes. Only incomplete frames and lines are
+    buffered, lines longer than ``max_line_length`` are split.
+    """
+
+    def __init__(
+        self, multiplexed: bool | None = None, max_line_length: int = 64 * 1024
+    ) -> None:
+        """Constructor method."""
+        self.multiplexed = multiplexed
+        self._max_line_length = max_line_length
+        self._buffer = bytearray()
+        self._lines: dict[int, bytearray] = {}
+
+    def _detect(self) -> bool:
+        """Decide on the format once enough bytes are buffered."""
+        if len(self._buffer) < _HEADER_SIZE:
+            return False
+        header = self._buffer[:_HEADER_SIZE]
+        self.multiplexed = header[0] in DOCKER_LOG_STREAMS and header[1:4] == bytes(3)
+        return True
+
+    def _frames(self, chunk: bytes) -> Iterator[tuple[int, bytes]]:
+        """Return the (stream type, payload) of the complete frames."""
+        self._buffer += chunk
+        if self.multiplexed is None and not self._detect():
+            return
+        if not self.multiplexed:
+            payload = bytes(self._buffer)
+            self._buffer.clear()
+            yield _STDOUT, payload
+            return
+        view = memoryview(self._buffer)
+        offset = 0
+        try:
+            while len(self._buffer) - offset >= _HEADER_SIZE:
+                size = int.from_bytes(view[offset + 4 : offset + 8], "big")
+                end = offset + _HEADER_SIZE + size
+                if len(self._buffer) < end:
+                    break
+                yield self._buffer[offset], bytes(view[offset + _HEADER_SIZE : end])
+                offset = end
+        finally:
+            view.release()
+        del self._buffer[:offset]
+
+    def feed(self, chunk: bytes) -> Iterator[tuple[str, bytes]]:
+        """Return the (stream name, line) of the lines completed by a chunk."""
+        for stream, payload in self._frames(chunk):
+            line = self._lines.setdefault(stream, bytearray())
+            line += payload
+            name = DOCKER_LOG_STREAMS.get(stream, str(stream))
+            start = 0
+            while True:
+                end = line.find(b"\n", start)
+                if end < 0:
+                    break
+                yield name, bytes(line[start:end])
+                start = end + 1
+            while len(line) - start > self._max_line_length:
+                yield name, bytes(line[start : start + self._max_line_length])
+                start += self._max_line_length
+            del line[:start]
+
+    def flush(self) -> Iterator[tuple[str, bytes]]:
+        """Return the incomplete lines at the end of the stream."""
+        if self.multiplexed is None and self._buffer:
+            # Too short for a header
+            self.multiplexed = False
+            yield from self.feed(b"")
+        for stream, line in self._lines.items():
+            if line:
+                yield DOCKER_LOG_STREAMS.get(stream, str(stream)), bytes(line)
+        self._lines.clear()
+
+
+async def tail_logs(
+    containers: Iterable[PortainerDockerContainer],
+    max_queue: int = 1000,
+    **kwargs: Any,
+) -> AsyncIterator[PortainerLogLine]:
+    """Stream the logs of many containers concurrently, as one iterator.
+
+    ``kwargs`` are passed to stream_logs() of every container. Lines are
+    yielded as they arrive; when more than ``max_queue`` lines wait for the
+    consumer the streams pause. A container whose stream fails is logged
+    and dropped. Closing the iterator closes all streams.
+
+    Yields:
+        The log lines of all containers, in the order they arrive.
+    """
+    queue: asyncio.Queue[PortainerLogLine | None] = asyncio.Queue(max_queue)
+
+    async def stream(container: PortainerDockerContainer) -> None:
+        try:
+            async for line in container.stream_logs(**kwargs):
+                await queue.put(line)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Log stream of %s failed", container.name, exc_info=True)
+        await queue.put(None)
+
+    tasks = [asyncio.ensure_future(stream(container)) for container in containers]
+    running = len(tasks)
+    try:
+        while running:
+            line = await queue.get()
+            if line is None:
+                running -= 1
+            else:
+                yield line
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
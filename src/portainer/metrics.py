@@ -0,0 +1,147 @@
+"""Request instrumentation for Portainer."""
+from __future__ import annotations
+
+import bisect
+import time
+from typing import Any
+
+from .helpers import get_api_template, get_environment_id
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class PortainerRequestEvent:
+    """Describes one API request, passed to the request hooks when it ends."""
+
+    __slots__ = (
+        "method",
+        "api",
+        "template",
+        "environment_id",
+        "status_code",
+        "size",
+        "cached",
+        "retries",
+        "error",
+        "started",
+        "sent",
+        "finished",
+    )
+
+    def __init__(self, method: str, api: str) -> None:
+        """Constructor method."""
+        self.method = method
+        self.api = api
+        self.template = get_api_template(api)
+        self.environment_id = get_environment_id(api)
+        self.status_code: int | None = None
+        self.size = 0
+        self.cached = False
+        self.retries = 0
+        self.error: BaseException | None = None
+        self.started = time.perf_counter()
+        self.sent: float | None = None
+        self.finished: float | None = None
+
+    @property
+    def queue_wait(self) -> float:
+        """Return the seconds between the call and sending the request."""
+        if self.sent is None:
+            return 0.0
+        return self.sent - self.started
+
+    @property
+    def latency(self) -> float:
+        """Return the total seconds the request took."""
+        if self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return (
+            f"<PortainerRequestEvent {self.method} {self.api} "
+            f"status={self.status_code} latency={self.latency:.3f}s>"
+        )
+
+
+class _ApiMetrics:
+    """Aggregated metrics of one API."""
+
+    __slots__ = ("count", "errors", "cached", "retries", "bytes", "latency", "buckets")
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        self.count = 0
+        self.errors = 0
+        self.cached = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def percentile(self, percentile: float) -> float:
+        """Estimate a latency percentile as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        rank = percentile / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                if index < len(LATENCY_BUCKETS):
+                    return float(LATENCY_BUCKETS[index])
+                return float("inf")
+        return float("inf")
+
+
+class PortainerMetrics:
+    """In-memory aggregation of request events per API.
+
+    Register it with ``Portainer.add_request_hook(metrics)``. Requests are
+    grouped on the API constant they use, e.g. all stats requests together.
+    """
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        self._apis: dict[tuple[str, str], _ApiMetrics] = {}
+
+    def __call__(self, event: PortainerRequestEvent) -> None:
+        """Record a request event."""
+        key = (event.method, event.template)
+        metrics = self._apis.get(key)
+        if metrics is None:
+            metrics = self._apis[key] = _ApiMetrics()
+        metrics.count += 1
+        metrics.retries += event.retries
+        metrics.bytes += event.size
+        metrics.latency += event.latency
+        if event.cached:
+            metrics.cached += 1
+        if event.error is not None or (event.status_code or 0) >= 400:
+            metrics.errors += 1
+        metrics.buckets[bisect.bisect_left(LATENCY_BUCKETS, event.latency)] += 1
+
+    def reset(self) -> None:
+        """Forget all recorded events."""
+        self._apis.clear()
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Return the metrics per "METHOD template"."""
+        return {
+            f"{method} {template}": {
+                "count": metrics.count,
+                "errors": metrics.errors,
+                "cached": metrics.cached,
+                "retries": metrics.retries,
+                "bytes": metrics.bytes,
+                "latency_avg": metrics.latency / metrics.count,
+                "latency_p50": metrics.percentile(50),
+                "latency_p90": metrics.percentile(90),
+                "latency_p99": metrics.percentile(99),
+                "latency_buckets": dict(
+                    zip(LATENCY_BUCKETS + (float("inf"),), metrics.buckets, strict=True)
+                ),
+            }
+            for (method, template), metrics in self._apis.items()
+        }
@@ -2,16 +2,33 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
 from json import JSONDecodeError
-from typing import List, Union
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List, Union
 from urllib.parse import quote, urlencode
 
 import aiohttp
-import async_timeout
 from yarl import URL
 
-from .const import API_AUTH, API_ENDPOINTS, API_LICENCES, API_STATUS, API_VERSION, API_SNAPSHOT
+from .auth import PortainerTokenManager
+from .bulk import PortainerBulkResult, check_image_status, run_bulk
+from .cache import PortainerImageStatusCache, PortainerResponseCache
+from .const import (
+    API_AUTH,
+    API_ENDPOINTS,
+    API_LICENCES,
+    API_STACK,
+    API_STACKS,
+    API_STATUS,
+    API_VERSION,
+    API_SNAPSHOT,
+    HEADER_TOTAL_COUNT,
+)
+from .decoder import PortainerJSONDecoder
+from .docker_container import PortainerDockerContainer
 from .endpoint import PortainerEndpoint
 from .exceptions import (
     PortainerException,
@@ -19,6 +36,13 @@ from .exceptions import (
     PortainerNotLoggedInException,
     PortainerRequestException,
 )
+from .helpers import get_environment_id
+from .history import aggregate_stats
+from .metrics import PortainerRequestEvent
+from .ratelimit import PortainerRateLimiter
+from .retry import PortainerCircuitBreaker, PortainerRetryPolicy
+from .session import connection_pool_stats, create_session
+from .stack import PortainerStack
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -28,7 +52,7 @@ class Portainer:
 
     def __init__(
         self,
-        session: aiohttp.ClientSession,
+        session: aiohttp.ClientSession | None,
         portainer_ip: str,
         portainer_port: int,
         username: str,
@@ -36,8 +60,34 @@ class Portainer:
         timeout: int = 600,
         use_https: bool = False,
         debugmode: bool = False,
+        cache: PortainerResponseCache | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        retry_policy: PortainerRetryPolicy | None = None,
+        circuit_breaker: PortainerCircuitBreaker | None = None,
+        connection_limit: int = 20,
+        verify_ssl: bool = True,
+        json_decoder: PortainerJSONDecoder | None = None,
+        image_status_cache: PortainerImageStatusCache | None = None,
+        label_whitelist: Iterable[str] | None = None,
+        rate_limiter: PortainerRateLimiter | None = None,
+        stats_history_size: int = 0,
     ):
-        """Constructor method."""
+        """Constructor method.
+
+        Without ``session`` the instance creates and owns a session tuned for
+        this host, limited to ``connection_limit`` connections, which is
+        closed by close() or when leaving ``async with``.
+
+        ``timeout`` bounds a whole request, ``connect_timeout`` the connection
+        setup and ``read_timeout`` the wait for each chunk of the response.
+
+        With ``label_whitelist`` containers only keep the labels with these
+        keys, saving memory when holding many containers.
+
+        With ``stats_history_size`` containers keep the stats of that many
+        samples in ``stats_history``.
+        """
         self.update_available = ""
         self.latest_version = ""
         self.version = ""
@@ -49,12 +99,45 @@ class Portainer:
         self._debugmode = debugmode
 
         self._timeout = timeout
+        self._client_timeout = aiohttp.ClientTimeout(
+            total=timeout, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+
+        # Opt-in retries and fail fast for unavailable environments
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+
+        # Opt-in admission control, by priority
+        self.rate_limiter = rate_limiter
 
         # Session
         self._session = session
+        self._owns_session = session is None
+        self._connection_limit = connection_limit
+        self._verify_ssl = verify_ssl
+
+        # Opt-in response cache
+        self.cache = cache
+
+        # Containers keep all labels unless whitelisted
+        self.label_whitelist: frozenset[str] | None = (
+            frozenset(label_whitelist) if label_whitelist is not None else None
+        )
+
+        # Opt-in stats history per container
+        self.stats_history_size = stats_history_size
+
+        # Image update checks are shared by all containers of an image
+        self.image_status_cache = image_status_cache or PortainerImageStatusCache()
+
+        # Response decoding
+        self.json_decoder = json_decoder or PortainerJSONDecoder()
+
+        # Instrumentation
+        self._request_hooks: list[Callable[[PortainerRequestEvent], None]] = []
 
         # Login
-        self._auth_token: str | None = None
+        self._token_manager = PortainerTokenManager(self._request_token)
 
         # Build variables
         if use_https:
@@ -62,8 +145,42 @@ class Portainer:
         else:
             self._base_url = f"http://{portainer_ip}:{portainer_port}/api"
 
-    def _debuglog(self, message: str) -> None:
-        """Outputs message if debug mode is enabled."""
+    async def __aenter__(self) -> Portainer:
+        """Enter the context, the session is closed on exit."""
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Exit the context."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Stop refreshing the session and close the owned HTTP session."""
+        await self._token_manager.close()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session, creating the owned one on first use."""
+        if self._session is None:
+            self._session = create_session(
+                self._connection_limit, verify_ssl=self._verify_ssl
+            )
+        return self._session
+
+    def connection_pool_stats(self) -> dict[str, Any]:
+        """Return the utilization of the connection pool."""
+        return connection_pool_stats(self._session)
+
+    def _debuglog(self, message: str, *args: Any) -> None:
+        """Outputs message if debug mode is enabled.
+
+        The message is only formatted with args when it is output.
+        """
+        if not self._debugmode and not _LOGGER.isEnabledFor(logging.DEBUG):
+            return
+        if args:
+            message = message % args
         _LOGGER.debug(message)
         if self._debugmode:
             print("DEBUG: " + message)
@@ -76,6 +193,34 @@ class Portainer:
         """Handles API GET request."""
         return await self._request("GET", api, params)
 
+    async def put(self, api: str, params: dict | None = None) -> dict:
+        """Handles API PUT request."""
+        return await self._request("PUT", api, params)
+
+    def add_request_hook(
+        self, hook: Callable[[PortainerRequestEvent], None]
+    ) -> Callable[[], None]:
+        """Call the hook with a PortainerRequestEvent after every request.
+
+        Returns a function that removes the hook.
+        """
+        self._request_hooks.append(hook)
+
+        def remove_hook() -> None:
+            if hook in self._request_hooks:
+                self._request_hooks.remove(hook)
+
+        return remove_hook
+
+    def _emit(self, event: PortainerRequestEvent) -> None:
+        """Pass a finished request event to the hooks."""
+        event.finished = time.perf_counter()
+        for hook in list(self._request_hooks):
+            try:
+                hook(event)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in request hook %s", hook)
+
     async def _request(
         self,
         request_method: str,
@@ -84,22 +229,136 @@ class Portainer:
         retry_once: bool = True,
     ) -> dict:
         """Handles API request."""
+        if not self._request_hooks:
+            return await self._perform_request(request_method, api, params, retry_once)
+        event = PortainerRequestEvent(request_method, api)
+        try:
+            response = await self._perform_request(
+                request_method, api, params, retry_once, event
+            )
+        except BaseException as exp:
+            event.error = exp
+            self._emit(event)
+            raise
+        event.status_code = response["status_code"]
+        event.size = response.get("size", 0)
+        self._emit(event)
+        return response
+
+    async def _perform_request(
+        self,
+        request_method: str,
+        api: str,
+        params: dict | None = None,
+        retry_once: bool = True,
+        event: PortainerRequestEvent | None = None,
+    ) -> dict:
+        """Execute an API request, using the cache and renewing the session."""
+        cache_key = None
+        cache_entry = None
+        if self.cache is not None and request_method == "GET" and self.cache.ttl(api):
+            cache_key = self.cache.key(api, params)
+            cache_entry = self.cache.get(cache_key)
+            if cache_entry is not None and cache_entry.fresh:
+                self._debuglog("API: %s (cached)", api)
+                if event is not None:
+                    event.cached = True
+                return cache_entry.response
+
         url, params, headers = await self._prepare_request(api, params)
+        used_token = self._token_manager.token
+        if cache_entry is not None and headers is not None:
+            headers.update(cache_entry.conditional_headers())
 
         # Request data
-        self._debuglog("API: " + api)
-        self._debuglog("Request Method: " + request_method)
-        response = await self._execute_request(request_method, url, params, headers)
+        self._debuglog("API: %s", api)
+        self._debuglog("Request Method: %s", request_method)
+        response = await self._send_request(
+            request_method, api, url, params, headers, event
+        )
         self._debuglog("Successful returned data")
-        self._debuglog("RESPONSE: " + str(response))
+        self._debuglog("RESPONSE: %s", response)
 
         # Handle data errors
         if api != API_AUTH and response["status_code"] == 401 and retry_once:
-            # Session ID is expired
-            if self.login():
-                response = await self._request(request_method, api, params, False)
+            # Session ID is expired, all callers share one re-login
+            await self._token_manager.refresh(used_token)
+            return await self._perform_request(
+                request_method, api, params, False, event
+            )
+
+        if self.cache is not None:
+            if cache_key is None:
+                if request_method != "GET":
+                    self.cache.invalidate(api)
+            elif response["status_code"] == 304:
+                response = self.cache.revalidated(cache_key) or response
+                if event is not None:
+                    event.cached = True
+            elif response["status_code"] == 200:
+                self.cache.store(cache_key, api, response)
         return response
 
+    async def _send_request(
+        self,
+        request_method: str,
+        api: str,
+        url: str,
+        params: dict | None,
+        headers: dict | None,
+        event: PortainerRequestEvent | None = None,
+    ) -> dict:
+        """Execute a request applying the rate limiter, retries and circuit breaker.
+
+        Every attempt, including retries, is admitted by the rate limiter.
+
+        Raises:
+            PortainerRequestException: The last attempt failed.
+        """
+        environment_id = get_environment_id(api)
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.check(environment_id)
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(
+                    self.rate_limiter.priority(request_method, api), environment_id
+                )
+            if event is not None and event.sent is None:
+                event.sent = time.perf_counter()
+            try:
+                response = await self._execute_request(
+                    request_method, url, params, headers
+                )
+            except PortainerRequestException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure(environment_id)
+                if self.retry_policy is None or not self.retry_policy.should_retry(
+                    request_method, attempt
+                ):
+                    raise
+                delay = self.retry_policy.delay(attempt)
+            else:
+                status_code = response["status_code"]
+                if self.circuit_breaker is not None:
+                    if status_code >= 500:
+                        self.circuit_breaker.record_failure(environment_id)
+                    else:
+                        self.circuit_breaker.record_success(environment_id)
+                if self.retry_policy is None or not self.retry_policy.should_retry(
+                    request_method, attempt, status_code
+                ):
+                    return response
+                headers_received = response.get("headers") or {}
+                delay = self.retry_policy.delay(
+                    attempt, headers_received.get("Retry-After")
+                )
+            self._debuglog("Retrying %s in %.2fs (attempt %s)", api, delay, attempt)
+            if event is not None:
+                event.retries += 1
+            await asyncio.sleep(delay)
+
     async def _prepare_request(
         self,
         api: str,
@@ -107,64 +366,185 @@ class Portainer:
     ) -> tuple[str, dict, dict | None]:
         """Prepare the url and parameters for a request."""
         # Check if logged
-        if not self._auth_token and api not in [API_AUTH]:
-            raise PortainerNotLoggedInException
+        token = None
+        if api != API_AUTH:
+            token = await self._token_manager.get_token()
+            if not token:
+                raise PortainerNotLoggedInException
         # Build request params
         if not params:
             params = {}
         headers = None
-        if self._auth_token:
-            headers = {"Authorization": f"Bearer {self._auth_token}"}
+        if token:
+            headers = {"Authorization": f"Bearer {token}"}
         url = f"{self._base_url}/{api}"
         return (url, params, headers)
 
-    async def _execute_request(
-        self, method: str, url: str, params: dict | None, headers: dict | None = None
-    ) -> dict:
-        """Function to execute and handle a request."""
+    @staticmethod
+    def _encode_url(url: str, params: dict | None) -> URL:
+        """Return the url with the encoded query parameters."""
         if params:
             # special handling for spaces in parameters
             # because yarl.URL does encode a space as + instead of %20
             # safe extracted from yarl.URL._QUERY_PART_QUOTER
             safe = "?/:@-._~!$'()*,"
             query = urlencode(params, safe=safe, quote_via=quote)
-            url_encoded = URL(str(URL(url)) + "?" + query, encoded=True)
-        else:
-            url_encoded = URL(url)
+            return URL(str(URL(url)) + "?" + query, encoded=True)
+        return URL(url)
+
+    async def _execute_request(
+        self, method: str, url: str, params: dict | None, headers: dict | None = None
+    ) -> dict:
+        """Function to execute and handle a request."""
+        url_encoded = self._encode_url(url, params)
 
         try:
             if method == "GET":
-                async with async_timeout.timeout(self._timeout):
-                    response = await self._session.get(url_encoded, headers=headers)
+                response = await self._get_session().get(
+                    url_encoded, headers=headers, timeout=self._client_timeout
+                )
             elif method == "POST":
-                self._debuglog("POST data: " + str(params))
-                async with async_timeout.timeout(self._timeout):
-                    response = await self._session.post(
-                        url, json=params, headers=headers
-                    )
-
-            response_url = response.url
-            self._debuglog("Request url: " + str(response_url))
-            self._debuglog("Response status_code: " + str(response.status))
-            self._debuglog("Response headers: " + str(dict(response.headers)))
+                self._debuglog("POST data: %s", params)
+                response = await self._get_session().post(
+                    url, json=params, headers=headers, timeout=self._client_timeout
+                )
+            elif method == "PUT":
+                self._debuglog("PUT data: %s", params)
+                response = await self._get_session().put(
+                    url, json=params, headers=headers, timeout=self._client_timeout
+                )
+
+            self._debuglog("Request url: %s", response.url)
+            self._debuglog("Response status_code: %s", response.status)
+            self._debuglog("Response headers: %s", response.headers)
 
             content_type = response.headers.get("Content-Type", "").split(";")[0]
-            ret: dict[str, str | int] = {}
+            raw = await response.read()
+            ret: dict[str, Any] = {}
             ret["status_code"] = response.status
+            ret["headers"] = response.headers
+            ret["size"] = len(raw)
             if content_type in [
                 "application/json",
                 "text/json",
             ]:
-                ret["body"] = await response.json(content_type=content_type)
+                ret["body"] = (
+                    self.json_decoder.decode(raw, url[len(self._base_url) + 1 :])
+                    if raw.strip()
+                    else None
+                )
             else:
-                ret["body"] = await response.text()
+                ret["body"] = raw.decode(response.get_encoding(), errors="replace")
             return ret
-        except (asyncio.TimeoutError, JSONDecodeError) as exp:
+        except (asyncio.TimeoutError, aiohttp.ClientError, JSONDecodeError) as exp:
             raise PortainerRequestException(exp) from exp
 
+    @asynccontextmanager
+    async def stream(
+        self,
+        api: str,
+        params: dict | None = None,
+        read_timeout: float | None = None,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Open a streaming API GET request.
+
+        The response body is not read, the caller consumes it from
+        ``response.content``. The connection is closed when the context
+        exits, also on cancellation. ``read_timeout`` bounds the time between
+        two chunks, there is no limit on the total duration. The request
+        event is emitted when the stream is closed.
+
+        Yields:
+            The response with the unread body.
+
+        Raises:
+            PortainerRequestException: The request failed, broke or stalled.
+            PortainerException: The API returned an error status.
+        """
+        event = PortainerRequestEvent("GET", api)
+        url, params, headers = await self._prepare_request(api, params)
+        used_token = self._token_manager.token
+        self._debuglog("API: %s", api)
+        self._debuglog("Request Method: GET (stream)")
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=self._client_timeout.sock_connect or self._timeout,
+            sock_read=read_timeout,
+        )
+        url_encoded = self._encode_url(url, params)
+        environment_id = get_environment_id(api)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.check(environment_id)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(
+                self.rate_limiter.priority("GET", api), environment_id
+            )
+        event.sent = time.perf_counter()
+        try:
+            response = await self._get_session().get(
+                url_encoded, headers=headers, timeout=timeout
+            )
+            if response.status == 401:
+                response.close()
+                await self._token_manager.refresh(used_token)
+                _, _, headers = await self._prepare_request(api, params)
+                response = await self._get_session().get(
+                    url_encoded, headers=headers, timeout=timeout
+                )
+        except (asyncio.TimeoutError, aiohttp.ClientError) as exp:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure(environment_id)
+            event.error = exp
+            self._emit(event)
+            raise PortainerRequestException(exp) from exp
+
+        event.status_code = response.status
+        try:
+            self._debuglog("Response status_code: %s", response.status)
+            if self.circuit_breaker is not None:
+                if response.status >= 500:
+                    self.circuit_breaker.record_failure(environment_id)
+                else:
+                    self.circuit_breaker.record_success(environment_id)
+            if response.status != 200:
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.split(";")[0] in ["application/json", "text/json"]:
+                    body = await response.json(content_type=None)
+                    raise PortainerException(
+                        api,
+                        response.status,
+                        body.get("message"),
+                        body.get("details"),
+                    )
+                raise PortainerException(api, response.status, await response.text())
+            yield response
+        except (asyncio.TimeoutError, aiohttp.ClientError) as exp:
+            # The stream broke or stalled while it was read
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure(environment_id)
+            event.error = exp
+            raise PortainerRequestException(exp) from exp
+        except BaseException as exp:
+            # Closed or cancelled by the consumer is not a failure
+            if not isinstance(exp, (GeneratorExit, asyncio.CancelledError)):
+                event.error = exp
+            raise
+        finally:
+            event.size = response.content.total_bytes
+            response.close()
+            self._emit(event)
+
     async def login(self) -> bool:
         """Create a logged session."""
-        # First reset the session
+        await self._token_manager.refresh()
+        return True
+
+    async def logout(self) -> None:
+        """Forget the session and stop refreshing it in the background."""
+        await self._token_manager.close()
+
+    async def _request_token(self) -> str:
+        """Request a new JWT, use login() to share it between callers."""
         self._debuglog("Creating new session")
 
         params = {
@@ -175,8 +555,7 @@ class Portainer:
         # Request login
         response = await self.post(API_AUTH, params)
         if response["status_code"] == 200:
-            self._auth_token = response["body"]["jwt"]
-            return True
+            return str(response["body"]["jwt"])
 
         if response["status_code"] == 422:
             raise PortainerInvalidCredentialsException()
@@ -218,9 +597,47 @@ class Portainer:
         limit: int | None = None,
         group_ids: List[int] | None = None,
         endpoint_ids: List[int] | None = None,
+        exclude_snapshots: bool = False,
+        lazy: bool = False,
     ) -> List[PortainerEndpoint] | None:
-        """Get endpoints."""
-        params: dict[str, Union[int, list[int]]] = {}
+        """Get endpoints.
+
+        With ``exclude_snapshots`` the API leaves out the snapshots, the
+        endpoints have no containers until they are refreshed. With ``lazy``
+        the container objects are created on first access.
+        """
+        endpoints = await self.get_raw_endpoints(
+            start, limit, group_ids, endpoint_ids, exclude_snapshots
+        )
+        return [PortainerEndpoint(self, endpoint, lazy) for endpoint in endpoints]
+
+    async def get_raw_endpoints(
+        self,
+        start: int | None = None,
+        limit: int | None = None,
+        group_ids: List[int] | None = None,
+        endpoint_ids: List[int] | None = None,
+        exclude_snapshots: bool = False,
+    ) -> list[dict]:
+        """Get endpoints as returned by the API, without creating objects."""
+        endpoints, _ = await self._get_endpoints_page(
+            start, limit, group_ids, endpoint_ids, exclude_snapshots
+        )
+        return endpoints
+
+    async def _get_endpoints_page(
+        self,
+        start: int | None = None,
+        limit: int | None = None,
+        group_ids: List[int] | None = None,
+        endpoint_ids: List[int] | None = None,
+        exclude_snapshots: bool = False,
+    ) -> tuple[list[dict], int | None]:
+        """Get raw endpoints and the total count reported by the API."""
+        params: dict[str, Union[int, str, list[int]]] = {}
+        if exclude_snapshots:
+            # Portainer only accepts the lowercase literal
+            params["excludeSnapshots"] = "true"
         if start is not None:
             params["start"] = start
         if limit is not None:
@@ -232,14 +649,234 @@ class Portainer:
 
         response = await self.get(API_ENDPOINTS, params)
         if response["status_code"] == 200:
-            ret = []
-            endpoints = response["body"]
-            for endpoint in endpoints:
-                ret.append(PortainerEndpoint(self, endpoint))
-            return ret
+            total = (response.get("headers") or {}).get(HEADER_TOTAL_COUNT)
+            return list(response["body"]), int(total) if total else None
         raise PortainerException(
             API_ENDPOINTS,
             response["status_code"],
             response["body"]["message"],
             response["body"]["details"],
         )
+
+    def _endpoints_page_task(
+        self,
+        start: int,
+        limit: int,
+        group_ids: List[int] | None,
+        endpoint_ids: List[int] | None,
+        exclude_snapshots: bool,
+    ) -> asyncio.Future[tuple[list[dict], int | None]]:
+        """Start requesting a page of endpoints."""
+        return asyncio.ensure_future(
+            self._get_endpoints_page(
+                start, limit, group_ids, endpoint_ids, exclude_snapshots
+            )
+        )
+
+    async def iter_endpoints(
+        self,
+        page_size: int = 50,
+        prefetch: bool = True,
+        group_ids: List[int] | None = None,
+        endpoint_ids: List[int] | None = None,
+        exclude_snapshots: bool = False,
+        lazy: bool = False,
+    ) -> AsyncIterator[PortainerEndpoint]:
+        """Iterate over all endpoints, requesting them one page at a time.
+
+        With ``prefetch`` the next page is requested while the current one
+        is consumed. Paging stops at the total count the API reports or at
+        the first page that isn't full. ``exclude_snapshots`` and ``lazy``
+        work as in get_endpoints().
+
+        Yields:
+            The endpoints, in the order of the API.
+
+        Raises:
+            ValueError: ``page_size`` is lower than 1.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        start = 0
+        page = self._endpoints_page_task(
+            start, page_size, group_ids, endpoint_ids, exclude_snapshots
+        )
+        try:
+            while True:
+                endpoints, total = await page
+                start += len(endpoints)
+                more = len(endpoints) == page_size and (total is None or start < total)
+                if more and prefetch:
+                    page = self._endpoints_page_task(
+                        start, page_size, group_ids, endpoint_ids, exclude_snapshots
+                    )
+                for endpoint in endpoints:
+                    yield PortainerEndpoint(self, endpoint, lazy)
+                if not more:
+                    return
+                if not prefetch:
+                    page = self._endpoints_page_task(
+                        start, page_size, group_ids, endpoint_ids, exclude_snapshots
+                    )
+        finally:
+            page.cancel()
+
+    async def bulk_container_action(
+        self,
+        action: str | Callable[..., Awaitable[Any]],
+        endpoints: Iterable[PortainerEndpoint],
+        container_filter: Callable[[PortainerDockerContainer], bool] | None = None,
+        limit: int = 10,
+        endpoint_limit: int | None = 2,
+        order_by_endpoint: bool = True,
+        **kwargs: Any,
+    ) -> list[PortainerBulkResult]:
+        """Run an action on the (filtered) containers of many endpoints.
+
+        The action is a container method name (e.g. "restart", "get_stats")
+        or a coroutine function taking the container. Each container gets
+        its own result or exception, a failure does not stop the others.
+        """
+        containers = [
+            container
+            for endpoint in endpoints
+            for container in endpoint.docker_container.values()
+            if container_filter is None or container_filter(container)
+        ]
+        return await run_bulk(
+            containers,
+            action,
+            limit=limit,
+            endpoint_limit=endpoint_limit,
+            order_by_endpoint=order_by_endpoint,
+            **kwargs,
+        )
+
+    async def check_image_updates(
+        self,
+        endpoints: Iterable[PortainerEndpoint],
+        container_filter: Callable[[PortainerDockerContainer], bool] | None = None,
+        limit: int = 5,
+    ) -> list[PortainerBulkResult]:
+        """Request the image status of the (filtered) containers of endpoints.
+
+        Each distinct image is checked once, statuses are cached in
+        ``image_status_cache``. ``limit`` bounds the concurrent checks, and
+        with it the load on the registries.
+        """
+        containers = [
+            container
+            for endpoint in endpoints
+            for container in endpoint.docker_container.values()
+            if container_filter is None or container_filter(container)
+        ]
+        return await check_image_status(containers, self.image_status_cache, limit)
+
+    def aggregate_stats(
+        self,
+        endpoints: Iterable[PortainerEndpoint],
+        metric: str,
+        func: str = "mean",
+        window: float | None = None,
+    ) -> float | None:
+        """Return an aggregate of a stats metric over the containers of endpoints.
+
+        See aggregate_stats() of the history module.
+        """
+        return aggregate_stats(
+            (
+                container
+                for endpoint in endpoints
+                for container in endpoint.docker_container.values()
+            ),
+            metric,
+            func,
+            window,
+        )
+
+    async def get_stacks(self, endpoint_id: int | None = None) -> list[PortainerStack]:
+        """Get the stacks, of one endpoint when ``endpoint_id`` is given."""
+        params = {}
+        if endpoint_id is not None:
+            params["filters"] = json.dumps({"EndpointID": endpoint_id})
+        response = await self.get(API_STACKS, params)
+        if response["status_code"] == 200:
+            return [PortainerStack(self, stack) for stack in response["body"] or []]
+        raise PortainerException(
+            API_STACKS,
+            response["status_code"],
+            response["body"]["message"],
+            response["body"]["details"],
+        )
+
+    async def get_stack(self, stack_id: int) -> PortainerStack:
+        """Get a stack by id."""
+        api = API_STACK.format(stack_id=stack_id)
+        response = await self.get(api)
+        if response["status_code"] == 200:
+            return PortainerStack(self, response["body"])
+        raise PortainerException(
+            api,
+            response["status_code"],
+            response["body"]["message"],
+            response["body"]["details"],
+        )
+
+    async def redeploy_stacks(
+        self,
+        stacks: Iterable[PortainerStack],
+        limit: int = 5,
+        progress: Callable[[PortainerStack, str, BaseException | None], None]
+        | None = None,
+        pull_image: bool = True,
+        prune: bool = False,
+        env: list[dict[str, str]] | None = None,
+    ) -> list[PortainerBulkResult]:
+        """Redeploy many stacks, at most ``limit`` at the same time.
+
+        ``progress`` is called with the stack and "started", "done" or
+        "failed" (with the exception) as each redeploy advances. A failed
+        redeploy does not stop the others, its exception is returned in its
+        result. Cancelling the call cancels the redeploys in progress and
+        the ones that didn't start yet.
+        """
+
+        async def redeploy(stack: PortainerStack) -> None:
+            if progress is not None:
+                progress(stack, "started", None)
+            try:
+                await stack.redeploy(pull_image=pull_image, prune=prune, env=env)
+            except Exception as exp:
+                if progress is not None:
+                    progress(stack, "failed", exp)
+                raise
+            if progress is not None:
+                progress(stack, "done", None)
+
+        return await run_bulk(stacks, redeploy, limit=limit, endpoint_limit=1)
+
+    async def redeploy_stack(
+        self,
+        name: str,
+        endpoint_ids: Iterable[int] | None = None,
+        limit: int = 5,
+        progress: Callable[[PortainerStack, str, BaseException | None], None]
+        | None = None,
+        pull_image: bool = True,
+        prune: bool = False,
+        env: list[dict[str, str]] | None = None,
+    ) -> list[PortainerBulkResult]:
+        """Redeploy the stack named ``name`` on every endpoint running it.
+
+        ``endpoint_ids`` restricts the endpoints, the other arguments work
+        as in redeploy_stacks().
+        """
+        wanted = set(endpoint_ids) if endpoint_ids is not None else None
+        stacks = [
+            stack
+            for stack in await self.get_stacks()
+            if stack.name == name and (wanted is None or stack.endpoint_id in wanted)
+        ]
+        return await self.redeploy_stacks(
+            stacks, limit, progress, pull_image=pull_image, prune=prune, env=env
+        )
@@ -0,0 +1,235 @@
+"""Client-side rate limiting and prioritization of Portainer requests."""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+import time
+from typing import Any, Mapping
+
+from .const import (
+    API_AUTH,
+    API_CONTAINER_SNAPSHOT,
+    API_IMAGE_STATUS,
+    API_SNAPSHOT,
+    API_STATS,
+    REQUEST_PRIORITY_HIGH,
+    REQUEST_PRIORITY_LOW,
+    REQUEST_PRIORITY_NAMES,
+    REQUEST_PRIORITY_NORMAL,
+)
+from .helpers import get_api_template
+
+# Bulk reads that can wait for everything else
+DEFAULT_PRIORITIES: Mapping[str, int] = {
+    API_AUTH: REQUEST_PRIORITY_HIGH,
+    API_STATS: REQUEST_PRIORITY_LOW,
+    API_SNAPSHOT: REQUEST_PRIORITY_LOW,
+    API_CONTAINER_SNAPSHOT: REQUEST_PRIORITY_LOW,
+    API_IMAGE_STATUS: REQUEST_PRIORITY_LOW,
+}
+
+
+class _TokenBucket:
+    """Token bucket refilled with ``rate`` tokens per second up to ``burst``."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        """Constructor method."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Return the seconds until a token is available, 0 when it is."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Consume a token."""
+        self.tokens -= 1
+
+
+class _Waiter:
+    """A request waiting for admission."""
+
+    __slots__ = ("priority", "sequence", "environment_id", "future")
+
+    def __init__(
+        self,
+        priority: int,
+        sequence: int,
+        environment_id: int | None,
+        future: asyncio.Future[None],
+    ) -> None:
+        """Constructor method."""
+        self.priority = priority
+        self.sequence = sequence
+        self.environment_id = environment_id
+        self.future = future
+
+    def __lt__(self, other: _Waiter) -> bool:
+        """Order on priority, then on arrival."""
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class PortainerRateLimiter:
+    """Token bucket rate limiter with priority classes.
+
+    ``rate`` requests per second are admitted in total, with bursts of up to
+    ``burst``, and ``environment_rate`` per environment with bursts of up to
+    ``environment_burst``. Either limit is optional. Waiting requests are
+    admitted by priority and then in arrival order: mutating requests and
+    logins are high priority, stats, snapshots and image status checks low
+    priority and other reads normal. ``priorities`` overrides the priority
+    of API constants. A request waiting only on the limit of its own
+    environment doesn't hold back requests on other environments.
+    """
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float | None = None,
+        environment_rate: float | None = None,
+        environment_burst: float | None = None,
+        priorities: Mapping[str, int] | None = None,
+    ) -> None:
+        """Constructor method."""
+        for value in (rate, environment_rate):
+            if value is not None and value <= 0:
+                raise ValueError("Rates must be positive")
+        self._bucket = (
+            _TokenBucket(rate, burst or max(rate, 1)) if rate is not None else None
+        )
+        self._environment_rate = environment_rate
+        self._environment_burst = environment_burst or max(environment_rate or 1, 1)
+        self._environment_buckets: dict[int, _TokenBucket] = {}
+        self._priorities = {**DEFAULT_PRIORITIES, **(priorities or {})}
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._waits = {
+            priority: {"count": 0, "total": 0.0, "max": 0.0}
+            for priority in REQUEST_PRIORITY_NAMES
+        }
+
+    def priority(self, method: str, api: str) -> int:
+        """Return the priority of a request."""
+        priority = self._priorities.get(get_api_template(api))
+        if priority is not None:
+            return priority
+        if method != "GET":
+            return REQUEST_PRIORITY_HIGH
+        return REQUEST_PRIORITY_NORMAL
+
+    def _environment_bucket(self, environment_id: int | None) -> _TokenBucket | None:
+        """Return the bucket of an environment, None when not limited."""
+        if self._environment_rate is None or environment_id is None:
+            return None
+        bucket = self._environment_buckets.get(environment_id)
+        if bucket is None:
+            bucket = self._environment_buckets[environment_id] = _TokenBucket(
+                self._environment_rate, self._environment_burst
+            )
+        return bucket
+
+    def _admit(self, environment_id: int | None, now: float) -> float:
+        """Take the tokens of a request, or return the seconds to wait.
+
+        Returns a negative delay when only the environment limit blocks.
+        """
+        if self._bucket is not None:
+            delay = self._bucket.delay(now)
+            if delay:
+                return delay
+        bucket = self._environment_bucket(environment_id)
+        if bucket is not None:
+            delay = bucket.delay(now)
+            if delay:
+                return -delay
+            bucket.take()
+        if self._bucket is not None:
+            self._bucket.take()
+        return 0.0
+
+    def _record(self, priority: int, wait: float) -> None:
+        """Record the time a request waited."""
+        waits = self._waits.setdefault(priority, {"count": 0, "total": 0.0, "max": 0.0})
+        waits["count"] += 1
+        waits["total"] += wait
+        waits["max"] = max(waits["max"], wait)
+
+    async def acquire(
+        self, priority: int = REQUEST_PRIORITY_NORMAL, environment_id: int | None = None
+    ) -> float:
+        """Wait until a request may be sent, return the seconds waited."""
+        started = time.monotonic()
+        if not self._waiters and not self._admit(environment_id, started):
+            self._record(priority, 0.0)
+            return 0.0
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, next(self._sequence), environment_id, future)
+        bisect.insort(self._waiters, waiter)
+        self._schedule(0)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        wait = time.monotonic() - started
+        self._record(priority, wait)
+        return wait
+
+    def _schedule(self, delay: float) -> None:
+        """Run the dispatcher after a delay."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Admit the waiting requests the buckets allow, by priority."""
+        self._timer = None
+        now = time.monotonic()
+        delays = []
+        for waiter in list(self._waiters):
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+                continue
+            delay = self._admit(waiter.environment_id, now)
+            if delay > 0:
+                # The global limit holds back all lower priority requests
+                delays.append(delay)
+                break
+            if delay < 0:
+                delays.append(-delay)
+                continue
+            self._waiters.remove(waiter)
+            waiter.future.set_result(None)
+        if self._waiters and delays:
+            self._schedule(min(delays))
+
+    def stats(self) -> dict[str, Any]:
+        """Return the queue depth and wait times per priority."""
+        queued = {name: 0 for name in REQUEST_PRIORITY_NAMES.values()}
+        for waiter in self._waiters:
+            name = REQUEST_PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+            queued[name] = queued.get(name, 0) + 1
+        return {
+            "queued": len(self._waiters),
+            "queued_by_priority": queued,
+            "waits": {
+                REQUEST_PRIORITY_NAMES.get(priority, str(priority)): {
+                    "count": waits["count"],
+                    "total": waits["total"],
+                    "max": waits["max"],
+                    "avg": waits["total"] / waits["count"] if waits["count"] else 0.0,
+                }
+                for priority, waits in self._waits.items()
+            },
+        }
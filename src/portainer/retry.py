@@ -0,0 +1,129 @@
+"""Retry policy and circuit breaker for Portainer requests."""
+from __future__ import annotations
+
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Collection
+
+from .exceptions import PortainerCircuitOpenException
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the seconds to wait from a Retry-After header."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class PortainerRetryPolicy:
+    """When and how long to wait before retrying a failed request.
+
+    Only requests with a method in ``methods`` are retried, by default the
+    idempotent GET. A request is retried after a connection error, a timeout
+    or a response with a status in ``statuses``. The delay grows
+    exponentially from ``backoff`` up to ``max_backoff`` with full jitter, a
+    ``Retry-After`` header takes precedence.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        methods: Collection[str] = ("GET",),
+        statuses: Collection[int] = (429, 502, 503, 504),
+    ) -> None:
+        """Constructor method."""
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = frozenset(methods)
+        self.statuses = frozenset(statuses)
+
+    def should_retry(
+        self, method: str, attempt: int, status_code: int | None = None
+    ) -> bool:
+        """Return True when a request failing with the status can be retried.
+
+        ``status_code`` is None when the request raised.
+        """
+        if attempt >= self.attempts or method not in self.methods:
+            return False
+        return status_code is None or status_code in self.statuses
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Return the seconds to wait before the next attempt."""
+        requested = parse_retry_after(retry_after)
+        if requested is not None:
+            return min(requested, self.max_backoff)
+        ceiling = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return random.uniform(0, ceiling)  # noqa: S311
+
+
+class PortainerCircuitBreaker:
+    """Fails requests to an environment fast after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the circuit of the
+    environment opens and requests raise PortainerCircuitOpenException.
+    After ``reset_timeout`` seconds one trial request is let through: success
+    closes the circuit, failure opens it again. A trial without outcome, e.g.
+    a cancelled request, expires after another ``reset_timeout`` seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        """Constructor method."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures: dict[int, int] = {}
+        self._opened: dict[int, float] = {}
+        # Start of the pending trial request by environment
+        self._trial: dict[int, float] = {}
+
+    def is_open(self, environment_id: int) -> bool:
+        """Return True when requests to the environment are blocked."""
+        opened = self._opened.get(environment_id)
+        if opened is None:
+            return False
+        trial = self._trial.get(environment_id)
+        if trial is not None and time.monotonic() - trial < self.reset_timeout:
+            return True
+        return time.monotonic() - opened < self.reset_timeout
+
+    def check(self, environment_id: int | None) -> None:
+        """Raise when the circuit of the environment is open."""
+        if environment_id is None or environment_id not in self._opened:
+            return
+        if self.is_open(environment_id):
+            raise PortainerCircuitOpenException(environment_id)
+        # Half open: let this request through as trial
+        self._trial[environment_id] = time.monotonic()
+
+    def record_success(self, environment_id: int | None) -> None:
+        """Close the circuit of the environment."""
+        if environment_id is None:
+            return
+        self._failures.pop(environment_id, None)
+        self._opened.pop(environment_id, None)
+        self._trial.pop(environment_id, None)
+
+    def record_failure(self, environment_id: int | None) -> None:
+        """Count a failure and open the circuit at the threshold."""
+        if environment_id is None:
+            return
+        self._trial.pop(environment_id, None)
+        failures = self._failures.get(environment_id, 0) + 1
+        self._failures[environment_id] = failures
+        if failures >= self.failure_threshold:
+            self._opened[environment_id] = time.monotonic()
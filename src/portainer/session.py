@@ -0,0 +1,50 @@
+"""HTTP session tuned for talking to one Portainer host."""
+from __future__ import annotations
+
+import ssl
+from typing import Any
+
+import aiohttp
+
+
+def create_session(
+    connection_limit: int = 20,
+    keepalive_timeout: float = 60,
+    dns_cache_ttl: int = 300,
+    verify_ssl: bool = True,
+) -> aiohttp.ClientSession:
+    """Create a session for requests to a single Portainer host.
+
+    Connections are kept alive and reused, DNS lookups are cached and one SSL
+    context is shared so TLS sessions can be resumed. Responses are
+    requested and decoded with gzip/deflate compression. Must be called from
+    a coroutine.
+    """
+    ssl_context: ssl.SSLContext | bool = False
+    if verify_ssl:
+        ssl_context = ssl.create_default_context()
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,
+        limit_per_host=connection_limit,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl,
+        use_dns_cache=True,
+        ssl=ssl_context,
+    )
+    return aiohttp.ClientSession(connector=connector, auto_decompress=True)
+
+
+def connection_pool_stats(session: aiohttp.ClientSession | None) -> dict[str, Any]:
+    """Return the utilization of the connection pool of a session."""
+    connector = session.connector if session is not None else None
+    if connector is None:
+        return {"limit": 0, "limit_per_host": 0, "acquired": 0, "idle": 0}
+    # aiohttp has no public API for the pool content
+    acquired = getattr(connector, "_acquired", ())
+    idle = getattr(connector, "_conns", {})
+    return {
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        "acquired": len(acquired),
+        "idle": sum(len(connections) for connections in idle.values()),
+    }
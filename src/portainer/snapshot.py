@@ -0,0 +1,132 @@
+"""Persistent store of the last known endpoints and containers."""
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+from .endpoint import PortainerEndpoint
+
+if TYPE_CHECKING:
+    from portainer import Portainer
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"PTNS"
+SNAPSHOT_VERSION = 1
+
+# Magic, version, endpoint count, save time
+_HEADER = struct.Struct("<4sHxxId")
+# Endpoint id, query date, record offset, record length
+_INDEX_ENTRY = struct.Struct("<qqQI")
+
+
+class PortainerSnapshotStore:
+    """Saves endpoints and their containers to a file, for a fast warm start.
+
+    The file starts with a versioned header and an index of the endpoints
+    with their ``QueryDate``, followed by one compact JSON record per
+    endpoint. It is memory-mapped when read, so single endpoints are read
+    without loading the others. Files of another version or damaged files
+    are ignored, the file is replaced atomically on save.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        """Constructor method."""
+        self.path = os.fspath(path)
+        self.saved_at: float | None = None
+
+    def save(self, endpoints: Iterable[PortainerEndpoint]) -> None:
+        """Write the endpoints and their containers."""
+        self.write(self.encode(endpoints))
+
+    @staticmethod
+    def encode(
+        endpoints: Iterable[PortainerEndpoint],
+    ) -> list[tuple[int, int, bytes]]:
+        """Return the (endpoint id, query date, record) of every endpoint.
+
+        Encoding reads the endpoints, write() only the result, so the file
+        can be written in another thread.
+        """
+        return [
+            (
+                endpoint.endpoint_id,
+                endpoint.time or 0,
+                json.dumps(endpoint.as_dict(), separators=(",", ":")).encode(),
+            )
+            for endpoint in endpoints
+        ]
+
+    def write(self, records: list[tuple[int, int, bytes]]) -> None:
+        """Write encoded endpoints, replacing the file."""
+        saved_at = time.time()
+        offset = _HEADER.size + _INDEX_ENTRY.size * len(records)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(
+                _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), saved_at)
+            )
+            for endpoint_id, query_date, record in records:
+                file.write(
+                    _INDEX_ENTRY.pack(endpoint_id, query_date, offset, len(record))
+                )
+                offset += len(record)
+            for _, _, record in records:
+                file.write(record)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.saved_at = saved_at
+
+    def _read(
+        self,
+        endpoint_ids: Iterable[int] | None = None,
+        decode: Callable[[bytes], Any] = json.loads,
+    ) -> list[dict]:
+        """Return the raw endpoints in the file, all or those with the ids."""
+        wanted = set(endpoint_ids) if endpoint_ids is not None else None
+        try:
+            with open(self.path, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                magic, version, count, saved_at = _HEADER.unpack_from(data)
+                if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                    _LOGGER.info("Ignoring snapshot %s of another version", self.path)
+                    return []
+                endpoints = []
+                for index in range(count):
+                    endpoint_id, _, offset, length = _INDEX_ENTRY.unpack_from(
+                        data, _HEADER.size + index * _INDEX_ENTRY.size
+                    )
+                    if wanted is None or endpoint_id in wanted:
+                        endpoints.append(decode(data[offset : offset + length]))
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, struct.error) as exp:
+            _LOGGER.warning("Ignoring damaged snapshot %s: %s", self.path, exp)
+            return []
+        self.saved_at = saved_at
+        return endpoints
+
+    def load(
+        self,
+        portainer: Portainer,
+        endpoint_ids: Iterable[int] | None = None,
+        lazy: bool = True,
+    ) -> dict[int, PortainerEndpoint]:
+        """Return the saved endpoints by id, marked as stale.
+
+        With ``lazy`` the container objects are created on first access.
+        Returns nothing when there is no usable snapshot.
+        """
+        endpoints = {}
+        for raw_endpoint in self._read(endpoint_ids, portainer.json_decoder.decode):
+            endpoint = PortainerEndpoint(portainer, raw_endpoint, lazy)
+            endpoint.stale = True
+            endpoints[endpoint.endpoint_id] = endpoint
+        return endpoints
@@ -0,0 +1,141 @@
+"""Class to interact with Portainer stacks."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, NoReturn
+
+from .const import (
+    API_STACK,
+    API_STACK_FILE,
+    API_STACK_GIT_REDEPLOY,
+    API_STACK_START,
+    API_STACK_STOP,
+    STACK_STATUS_ACTIVE,
+)
+from .exceptions import PortainerException
+
+if TYPE_CHECKING:
+    from portainer import Portainer
+
+
+class PortainerStack:
+    """Portainer stack class."""
+
+    def __init__(self, portainer: Portainer, stack: dict) -> None:
+        """Constructor method."""
+        self._portainer = portainer
+        self.stack_id = 0
+        self.name = ""
+        self.type: int | None = None
+        self.endpoint_id = 0
+        self.status = 0
+        self.env: list[dict[str, str]] = []
+        self.git_config: dict[str, Any] | None = None
+        self.after_refresh(stack)
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return f"<PortainerStack {self.stack_id} {self.name}@{self.endpoint_id}>"
+
+    @property
+    def active(self) -> bool:
+        """Return True when the stack is started."""
+        return self.status == STACK_STATUS_ACTIVE
+
+    @property
+    def is_git(self) -> bool:
+        """Return True when the stack is deployed from a git repository."""
+        return bool(self.git_config)
+
+    def after_refresh(self, stack: dict) -> None:
+        """Sets all variables."""
+        self.stack_id = stack["Id"]
+        self.name = stack["Name"]
+        self.type = stack.get("Type")
+        self.endpoint_id = stack["EndpointId"]
+        self.status = stack.get("Status", 0)
+        self.env = stack.get("Env") or []
+        self.git_config = stack.get("GitConfig")
+
+    def _api(self, template: str) -> str:
+        """Return a stack API path for the endpoint of the stack."""
+        api = template.format(stack_id=self.stack_id)
+        return f"{api}?endpointId={self.endpoint_id}"
+
+    @staticmethod
+    def _raise(api: str, response: dict) -> NoReturn:
+        """Raise the error of a failed response."""
+        body = response["body"] if isinstance(response["body"], dict) else {}
+        raise PortainerException(
+            api,
+            response["status_code"],
+            body.get("message"),
+            body.get("details"),
+        )
+
+    async def refresh(self) -> None:
+        """Refreshes the properties."""
+        api = API_STACK.format(stack_id=self.stack_id)
+        response = await self._portainer.get(api)
+        if response["status_code"] == 200:
+            return self.after_refresh(response["body"])
+        self._raise(api, response)
+
+    async def start(self) -> None:
+        """Start the stack."""
+        api = self._api(API_STACK_START)
+        response = await self._portainer.post(api)
+        if response["status_code"] == 200:
+            return self.after_refresh(response["body"])
+        self._raise(api, response)
+
+    async def stop(self) -> None:
+        """Stop the stack."""
+        api = self._api(API_STACK_STOP)
+        response = await self._portainer.post(api)
+        if response["status_code"] == 200:
+            return self.after_refresh(response["body"])
+        self._raise(api, response)
+
+    async def get_file(self) -> str:
+        """Request the compose file of the stack."""
+        api = API_STACK_FILE.format(stack_id=self.stack_id)
+        response = await self._portainer.get(api)
+        if response["status_code"] == 200:
+            return str(response["body"]["StackFileContent"])
+        self._raise(api, response)
+
+    async def redeploy(
+        self,
+        pull_image: bool = True,
+        prune: bool = False,
+        env: list[dict[str, str]] | None = None,
+    ) -> None:
+        """Redeploy the stack, pulling its images with ``pull_image``.
+
+        Git stacks pull the latest commit of their repository first, other
+        stacks are redeployed with their current compose file. ``env``
+        replaces the environment variables of the stack.
+        """
+        data: dict[str, Any] = {
+            "Env": self.env if env is None else env,
+            "Prune": prune,
+            "PullImage": pull_image,
+        }
+        if self.is_git:
+            api = self._api(API_STACK_GIT_REDEPLOY)
+            git_config = self.git_config or {}
+            data["RepositoryReferenceName"] = git_config.get("ReferenceName", "")
+            authentication = git_config.get("Authentication")
+            if authentication:
+                # Use the credentials stored with the stack
+                data["RepositoryAuthentication"] = True
+                data["RepositoryGitCredentialID"] = authentication.get(
+                    "GitCredentialID", 0
+                )
+        else:
+            data["StackFileContent"] = await self.get_file()
+            api = self._api(API_STACK)
+        response = await self._portainer.put(api, data)
+        if response["status_code"] == 200:
+            return self.after_refresh(response["body"])
+        self._raise(api, response)
@@ -0,0 +1,140 @@
+"""Compact representation of docker container stats."""
+from __future__ import annotations
+
+import time
+from datetime import datetime
+from typing import Any
+
+
+def _parse_timestamp(value: Any) -> float | None:
+    """Parse a docker RFC 3339 timestamp with nanoseconds to a unix time."""
+    if not isinstance(value, str) or value.startswith("0001-"):
+        return None
+    value = value.replace("Z", "+00:00")
+    if "." in value:
+        # datetime only handles microseconds
+        main, rest = value.split(".", 1)
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        value = f"{main}.{rest[:digits][:6].ljust(6, '0')}{rest[digits:]}"
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _rate(current: int, previous: int, elapsed: float) -> float:
+    """Return the per second rate of a counter, 0 when it was reset."""
+    if elapsed <= 0 or current < previous:
+        return 0.0
+    return (current - previous) / elapsed
+
+
+class ContainerStats:
+    """One docker stats sample with derived percentages and rates.
+
+    Rates are computed against the previous sample of the same container
+    and are 0 for the first sample.
+    """
+
+    __slots__ = (
+        "timestamp",
+        "cpu_total",
+        "cpu_system",
+        "online_cpus",
+        "cpu_percent",
+        "memory_usage",
+        "memory_limit",
+        "memory_percent",
+        "network_rx",
+        "network_tx",
+        "network_rx_rate",
+        "network_tx_rate",
+        "block_read",
+        "block_write",
+        "block_read_rate",
+        "block_write_rate",
+        "pids",
+    )
+
+    def __init__(
+        self,
+        stats: dict,
+        previous: ContainerStats | None = None,
+    ) -> None:
+        """Constructor method."""
+        self.timestamp = _parse_timestamp(stats.get("read")) or time.time()
+
+        cpu_stats = stats.get("cpu_stats") or {}
+        cpu_usage = cpu_stats.get("cpu_usage") or {}
+        self.cpu_total: int = cpu_usage.get("total_usage", 0)
+        self.cpu_system: int = cpu_stats.get("system_cpu_usage", 0)
+        self.online_cpus: int = cpu_stats.get("online_cpus") or len(
+            cpu_usage.get("percpu_usage") or ()
+        )
+        precpu_stats = stats.get("precpu_stats") or {}
+        if precpu_stats.get("system_cpu_usage"):
+            pre_total = (precpu_stats.get("cpu_usage") or {}).get("total_usage", 0)
+            pre_system = precpu_stats["system_cpu_usage"]
+        elif previous is not None:
+            pre_total = previous.cpu_total
+            pre_system = previous.cpu_system
+        else:
+            pre_total = self.cpu_total
+            pre_system = self.cpu_system
+        cpu_delta = self.cpu_total - pre_total
+        system_delta = self.cpu_system - pre_system
+        self.cpu_percent = 0.0
+        if cpu_delta > 0 and system_delta > 0:
+            self.cpu_percent = (
+                cpu_delta / system_delta * max(self.online_cpus, 1) * 100.0
+            )
+
+        memory_stats = stats.get("memory_stats") or {}
+        memory_detail = memory_stats.get("stats") or {}
+        # Same as the docker cli: don't count the page cache
+        cache = memory_detail.get(
+            "total_inactive_file",
+            memory_detail.get("inactive_file", memory_detail.get("cache", 0)),
+        )
+        usage = memory_stats.get("usage", 0)
+        self.memory_usage: int = usage - cache if cache < usage else usage
+        self.memory_limit: int = memory_stats.get("limit", 0)
+        self.memory_percent = 0.0
+        if self.memory_limit:
+            self.memory_percent = self.memory_usage / self.memory_limit * 100.0
+
+        networks = (stats.get("networks") or {}).values()
+        self.network_rx: int = sum(network.get("rx_bytes", 0) for network in networks)
+        self.network_tx: int = sum(network.get("tx_bytes", 0) for network in networks)
+
+        self.block_read = 0
+        self.block_write = 0
+        blkio = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive")
+        for entry in blkio or ():
+            operation = entry.get("op", "").lower()
+            if operation == "read":
+                self.block_read += entry.get("value", 0)
+            elif operation == "write":
+                self.block_write += entry.get("value", 0)
+
+        self.pids: int = (stats.get("pids_stats") or {}).get("current", 0)
+
+        self.network_rx_rate = 0.0
+        self.network_tx_rate = 0.0
+        self.block_read_rate = 0.0
+        self.block_write_rate = 0.0
+        if previous is not None:
+            elapsed = self.timestamp - previous.timestamp
+            self.network_rx_rate = _rate(self.network_rx, previous.network_rx, elapsed)
+            self.network_tx_rate = _rate(self.network_tx, previous.network_tx, elapsed)
+            self.block_read_rate = _rate(self.block_read, previous.block_read, elapsed)
+            self.block_write_rate = _rate(
+                self.block_write, previous.block_write, elapsed
+            )
+
+    def __repr__(self) -> str:
+        """Return the representation."""
+        return (
+            f"<ContainerStats cpu={self.cpu_percent:.1f}% "
+            f"memory={self.memory_usage}/{self.memory_limit}>"
+        )
@@ -0,0 +1,141 @@
+"""Benchmarks of the client against a local fake Portainer.
+
+Run with ``python -m tests.benchmark`` from the repository root, with the
+package installed or ``src`` on the path. Every scenario reports the
+throughput, the p50 and p99 latency of one operation and the peak memory
+allocated by Python while it ran.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+from portainer import Portainer
+from portainer.endpoint import PortainerEndpoint
+from portainer.exceptions import PortainerException
+
+from .fake_portainer import FakePortainer
+
+
+async def measure(
+    name: str,
+    operation: Callable[[], Awaitable[Any]],
+    iterations: int,
+    concurrency: int = 1,
+) -> dict[str, Any]:
+    """Run an operation and return its statistics.
+
+    Failed operations, e.g. on injected errors, are counted and included in
+    the latencies.
+    """
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run() -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await operation()
+            except PortainerException:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(run() for _ in range(iterations)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        "scenario": name,
+        "operations": iterations,
+        "errors": errors,
+        "throughput": iterations / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "peak_memory": peak,
+    }
+
+
+async def run_benchmarks(args: argparse.Namespace) -> list[dict[str, Any]]:
+    """Run all scenarios against a fresh fake Portainer."""
+    fake = FakePortainer(args.endpoints, args.containers, args.latency, args.error_rate)
+    results = []
+    async with TestServer(fake.app) as server, aiohttp.ClientSession() as session:
+        portainer = Portainer(session, server.host, server.port, "admin", "pwd")
+        results.append(await measure("login", portainer.login, args.iterations))
+
+        results.append(
+            await measure(
+                "list endpoints", portainer.get_endpoints, max(args.iterations // 10, 1)
+            )
+        )
+
+        endpoints: list[PortainerEndpoint] = await portainer.get_endpoints() or []
+
+        async def refresh_all() -> None:
+            await asyncio.gather(*(endpoint.refresh() for endpoint in endpoints))
+
+        results.append(
+            await measure("bulk refresh", refresh_all, max(args.iterations // 10, 1))
+        )
+
+        containers = iter(
+            [
+                container
+                for endpoint in endpoints
+                for container in endpoint.docker_container.values()
+            ]
+        )
+
+        async def get_stats() -> None:
+            await next(containers).get_stats(keep_raw=False)
+
+        results.append(
+            await measure(
+                "stats polling",
+                get_stats,
+                args.endpoints * args.containers,
+                args.concurrency,
+            )
+        )
+    return results
+
+
+def main() -> None:
+    """Parse the arguments, run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", type=int, default=20)
+    parser.add_argument("--containers", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    print(
+        f"{'scenario':<16}{'ops':>8}{'errors':>8}{'ops/s':>12}{'p50 ms':>10}"
+        f"{'p99 ms':>10}{'peak MiB':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['scenario']:<16}{result['operations']:>8}{result['errors']:>8}"
+            f"{result['throughput']:>12.1f}{result['p50'] * 1000:>10.2f}"
+            f"{result['p99'] * 1000:>10.2f}"
+            f"{result['peak_memory'] / 1024 / 1024:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
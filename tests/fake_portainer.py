@@ -0,0 +1,245 @@
+"""Local fake Portainer server for tests and benchmarks."""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import random
+import time
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+
+def make_token(lifetime: float = 8 * 3600) -> str:
+    """Return an unsigned JWT expiring after the lifetime."""
+    payload = json.dumps({"exp": time.time() + lifetime}).encode()
+    claims = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"header.{claims}.signature"
+
+
+def make_container(endpoint_id: int, index: int) -> dict:
+    """Return a docker container as listed by the API."""
+    return {
+        "Id": f"{endpoint_id:04x}{index:060x}",
+        "Names": [f"/container-{index}"],
+        "Image": f"registry.local/app-{index % 15}:latest",
+        "ImageID": f"sha256:{index % 15:064x}",
+        "Command": "/entrypoint.sh",
+        "Created": 1700000000 + index,
+        "Ports": [{"PrivatePort": 80, "Type": "tcp"}],
+        "Labels": {
+            "com.docker.compose.project": f"stack-{index % 5}",
+            "com.docker.compose.service": f"service-{index}",
+            "com.docker.compose.version": "2.24.0",
+        },
+        "State": "running" if index % 10 else "exited",
+        "Status": "Up 2 hours" if index % 10 else "Exited (0) 1 hour ago",
+        "HostConfig": {"NetworkMode": "bridge"},
+        "NetworkSettings": {"Networks": {"bridge": {"IPAddress": "172.17.0.2"}}},
+        "Mounts": [],
+    }
+
+
+def make_endpoint(endpoint_id: int, containers: int) -> dict:
+    """Return an endpoint with a snapshot of its containers."""
+    return {
+        "Id": endpoint_id,
+        "Name": f"endpoint-{endpoint_id}",
+        "Type": 1,
+        "URL": "unix:///var/run/docker.sock",
+        "GroupId": 1,
+        "PublicURL": "",
+        "Status": 1,
+        "StatusMessage": {"Summary": "", "Detail": ""},
+        "QueryDate": 1700000000,
+        "Snapshots": [
+            {
+                "Time": 1700000000,
+                "DockerVersion": "24.0.7",
+                "RunningContainerCount": containers,
+                "DockerSnapshotRaw": {
+                    "Containers": [
+                        make_container(endpoint_id, index)
+                        for index in range(containers)
+                    ]
+                },
+            }
+        ],
+    }
+
+
+def make_stats(sample: int) -> dict:
+    """Return a docker stats sample."""
+    return {
+        "read": f"2024-01-01T00:00:{sample % 60:02d}.000000000Z",
+        "pids_stats": {"current": 12},
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 1000000 * sample},
+            "system_cpu_usage": 100000000 * sample,
+            "online_cpus": 4,
+        },
+        "precpu_stats": {
+            "cpu_usage": {"total_usage": 1000000 * (sample - 1)},
+            "system_cpu_usage": 100000000 * (sample - 1),
+            "online_cpus": 4,
+        },
+        "memory_stats": {
+            "usage": 50000000,
+            "limit": 2000000000,
+            "stats": {"inactive_file": 1000000},
+        },
+        "networks": {"eth0": {"rx_bytes": 1000 * sample, "tx_bytes": 500 * sample}},
+        "blkio_stats": {"io_service_bytes_recursive": []},
+    }
+
+
+def log_frame(stream: int, payload: bytes) -> bytes:
+    """Return a frame of a multiplexed docker log stream."""
+    return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+class FakePortainer:
+    """Portainer API serving generated endpoints and containers.
+
+    Serves ``endpoints`` endpoints with ``containers`` containers each.
+    Every request is delayed by ``latency`` seconds and fails with a 503
+    with probability ``error_rate``. Responses are generated once, so the
+    server adds little overhead to what is measured on the client.
+    """
+
+    def __init__(
+        self,
+        endpoints: int = 10,
+        containers: int = 20,
+        latency: float = 0,
+        error_rate: float = 0,
+        seed: int = 0,
+    ) -> None:
+        """Constructor method."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)  # noqa: S311
+        self.endpoints = [
+            make_endpoint(endpoint_id, containers)
+            for endpoint_id in range(1, endpoints + 1)
+        ]
+        self._endpoints = {endpoint["Id"]: endpoint for endpoint in self.endpoints}
+        self._bodies = {
+            endpoint["Id"]: json.dumps(endpoint).encode() for endpoint in self.endpoints
+        }
+        self._stats = [json.dumps(make_stats(sample)).encode() for sample in (1, 2)]
+
+    @property
+    def app(self) -> web.Application:
+        """Return the web application."""
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/api/auth", self._auth)
+        app.router.add_get("/api/system/status", self._status)
+        app.router.add_get("/api/system/version", self._version)
+        app.router.add_get("/api/endpoints", self._list_endpoints)
+        app.router.add_get("/api/endpoints/{environment_id}", self._endpoint)
+        docker = "/api/endpoints/{environment_id}/docker/containers"
+        app.router.add_get(f"{docker}/json", self._containers)
+        app.router.add_get(f"{docker}/{{container_id}}/stats", self._container_stats)
+        app.router.add_get(f"{docker}/{{container_id}}/logs", self._logs)
+        for action in ("start", "stop", "restart"):
+            app.router.add_post(f"{docker}/{{container_id}}/{action}", self._action)
+        app.router.add_get(
+            "/api/docker/{environment_id}/containers/{container_id}/image_status",
+            self._image_status,
+        )
+        return app
+
+    @web.middleware
+    async def _middleware(
+        self,
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.json_response(
+                {"message": "Injected error", "details": ""}, status=503
+            )
+        if request.path != "/api/auth" and not request.headers.get(
+            "Authorization", ""
+        ).startswith("Bearer "):
+            return web.json_response(
+                {"message": "Unauthorized", "details": ""}, status=401
+            )
+        return await handler(request)
+
+    def _get_endpoint(self, request: web.Request) -> dict:
+        endpoint = self._endpoints.get(int(request.match_info["environment_id"]))
+        if endpoint is None:
+            raise web.HTTPNotFound()
+        return endpoint
+
+    async def _auth(self, request: web.Request) -> web.Response:
+        return web.json_response({"jwt": make_token()})
+
+    async def _status(self, request: web.Request) -> web.Response:
+        return web.json_response({"Version": "2.19.4", "InstanceID": "fake"})
+
+    async def _version(self, request: web.Request) -> web.Response:
+        return web.json_response({"UpdateAvailable": False, "LatestVersion": ""})
+
+    async def _list_endpoints(self, request: web.Request) -> web.Response:
+        start = int(request.query.get("start", 0))
+        limit = int(request.query.get("limit", 0)) or len(self.endpoints)
+        page = self.endpoints[start : start + limit]
+        if request.query.get("excludeSnapshots") == "true":
+            page = [{**endpoint, "Snapshots": []} for endpoint in page]
+            body = json.dumps(page).encode()
+        else:
+            body = b"[" + b",".join(self._bodies[e["Id"]] for e in page) + b"]"
+        return web.Response(
+            body=body,
+            content_type="application/json",
+            headers={"X-Total-Count": str(len(self.endpoints))},
+        )
+
+    async def _endpoint(self, request: web.Request) -> web.Response:
+        endpoint = self._get_endpoint(request)
+        return web.Response(
+            body=self._bodies[endpoint["Id"]], content_type="application/json"
+        )
+
+    async def _containers(self, request: web.Request) -> web.Response:
+        endpoint = self._get_endpoint(request)
+        snapshot = endpoint["Snapshots"][0]["DockerSnapshotRaw"]
+        return web.json_response(snapshot["Containers"])
+
+    async def _container_stats(self, request: web.Request) -> web.StreamResponse:
+        self._get_endpoint(request)
+        if request.query.get("stream") != "true":
+            return web.Response(body=self._stats[1], content_type="application/json")
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        for sample in self._stats:
+            await response.write(sample + b"\n")
+        return response
+
+    async def _logs(self, request: web.Request) -> web.StreamResponse:
+        self._get_endpoint(request)
+        tail = request.query.get("tail", "all")
+        lines = 100 if tail == "all" else int(tail)
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/vnd.docker.multiplexed-stream"}
+        )
+        await response.prepare(request)
+        for index in range(lines):
+            await response.write(log_frame(1 + index % 2, b"log line %d\n" % index))
+        return response
+
+    async def _action(self, request: web.Request) -> web.Response:
+        self._get_endpoint(request)
+        return web.Response(status=204)
+
+    async def _image_status(self, request: web.Request) -> web.Response:
+        self._get_endpoint(request)
+        return web.json_response({"Status": "updated", "Message": ""})
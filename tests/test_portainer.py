@@ -1,5 +1,153 @@
 """Portainer tests."""
 # pylint: disable=protected-access
+import asyncio
+import base64
+import json
+import time
+from contextlib import aclosing
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from portainer import Portainer
+from portainer.auth import PortainerTokenManager, decode_jwt_expiry
+from portainer.bulk import run_bulk
+from portainer.cache import PortainerResponseCache
+from portainer.const import API_AUTH
+from portainer.coordinator import PortainerCoordinator
+from portainer.decoder import PortainerJSONDecoder
+from portainer.docker_container import PortainerDockerContainer
+from portainer.endpoint import PortainerContainerDiff, PortainerEndpoint
+from portainer.exceptions import (
+    PortainerCircuitOpenException,
+    PortainerException,
+    PortainerRequestException,
+)
+from portainer.federation import PortainerFederation, split_global_id
+from portainer.history import StatsHistory
+from portainer.index import PortainerContainerIndex
+from portainer.logs import DockerLogDemuxer, tail_logs
+from portainer.metrics import PortainerMetrics
+from portainer.ratelimit import PortainerRateLimiter
+from portainer.snapshot import PortainerSnapshotStore
+from portainer.retry import (
+    PortainerCircuitBreaker,
+    PortainerRetryPolicy,
+    parse_retry_after,
+)
+from portainer.stats import ContainerStats
+
+from . import PortainerMock
+from .fake_portainer import FakePortainer
+
+
+def make_jwt(expiry: float) -> str:
+    """Build an unsigned JWT with the given expiry."""
+    payload = json.dumps({"exp": expiry}).encode()
+    claims = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"header.{claims}.signature"
+
+
+def make_snapshot_container(
+    endpoint_id: str, name: str, state: str = "running"
+) -> dict:
+    """Build a container entry of an endpoint snapshot."""
+    return {
+        "Id": f"{endpoint_id}-{name}",
+        "Names": [f"/{name}"],
+        "Image": "nginx:latest",
+        "ImageID": "sha256:1",
+        "Created": 0,
+        "Labels": {},
+        "State": state,
+        "Status": "Up",
+    }
+
+
+def make_endpoint(endpoint_id: int, containers: list[dict]) -> dict:
+    """Build an endpoint as returned by the endpoints API."""
+    return {
+        "Id": endpoint_id,
+        "Name": f"endpoint{endpoint_id}",
+        "Type": 1,
+        "URL": "unix:///var/run/docker.sock",
+        "GroupId": 1,
+        "PublicURL": "",
+        "Status": 1,
+        "StatusMessage": {},
+        "QueryDate": 0,
+        "Snapshots": [{"DockerSnapshotRaw": {"Containers": containers}}],
+    }
+
+
+def make_container(
+    portainer: PortainerMock, endpoint_id: str, name: str, state: str = "running"
+) -> PortainerDockerContainer:
+    """Build a container object from a snapshot entry."""
+    return PortainerDockerContainer(
+        portainer, endpoint_id, make_snapshot_container(endpoint_id, name, state)
+    )
+
+
+class AuthPortainerMock(PortainerMock):
+    """Mocked Portainer that counts logins and expires tokens on demand."""
+
+    def __init__(self) -> None:
+        """Constructor method."""
+        super().__init__(None, "192.168.0.1", 9000, "admin", "password")
+        self.logins = 0
+        self.valid_token = ""  # noqa: S105
+
+    async def _execute_request(
+        self, method: str, url: str, params: dict | None, headers: dict | None = None
+    ) -> dict:
+        if url.endswith(API_AUTH):
+            self.logins += 1
+            await asyncio.sleep(0.01)
+            self.valid_token = make_jwt(time.time() + 3600 + self.logins)
+            return {"status_code": 200, "body": {"jwt": self.valid_token}}
+        if headers and headers["Authorization"] == f"Bearer {self.valid_token}":
+            return {"status_code": 200, "body": "test"}
+        return {"status_code": 401, "body": {"message": "", "details": ""}}
+
+
+class EndpointsPortainerMock(PortainerMock):
+    """Mocked Portainer serving a fixed list of endpoints."""
+
+    def __init__(self, endpoints: list[dict]) -> None:
+        """Constructor method."""
+        super().__init__(None, "192.168.0.1", 9000, "admin", "password")
+        self._token_manager.set_token("token")
+        self.endpoints = endpoints
+        self.requests: list[str] = []
+        self.failing: set[str] = set()
+
+    async def _execute_request(
+        self, method: str, url: str, params: dict | None, headers: dict | None = None
+    ) -> dict:
+        api = url[len(self._base_url) + 1 :]
+        self.requests.append(api)
+        await asyncio.sleep(0.01)
+        if api in self.failing:
+            return {"status_code": 503, "body": {"message": "", "details": ""}}
+        if api == "endpoints":
+            start = (params or {}).get("start", 0)
+            limit = (params or {}).get("limit") or len(self.endpoints)
+            page = self.endpoints[start : start + limit]
+            if (params or {}).get("excludeSnapshots"):
+                page = [{**endpoint, "Snapshots": []} for endpoint in page]
+            return {
+                "status_code": 200,
+                "headers": {"X-Total-Count": str(len(self.endpoints))},
+                "body": page,
+            }
+        for endpoint in self.endpoints:
+            if api == f"endpoints/{endpoint['Id']}":
+                return {"status_code": 200, "body": endpoint}
+        return {"status_code": 404, "body": {"message": "", "details": ""}}
 
 
 class TestPortainer:
@@ -7,3 +155,889 @@ class TestPortainer:
 
     def test_init(self) -> None:
         """Test init."""
+
+    def test_decode_jwt_expiry(self) -> None:
+        """Test reading the expiry from a JWT."""
+        assert decode_jwt_expiry(make_jwt(1234)) == 1234
+        assert decode_jwt_expiry("not-a-jwt") is None
+
+    @pytest.mark.asyncio
+    async def test_token_refresh_failure(self) -> None:
+        """Test a failed refresh falls back to the still valid token."""
+
+        async def login() -> str:
+            raise PortainerException(API_AUTH, 503, "unavailable")
+
+        manager = PortainerTokenManager(login)
+        token = make_jwt(time.time() + 30)
+        manager.set_token(token)
+        manager._refresh_at = time.time()
+        assert await manager.get_token() == token
+        manager._expires_at = time.time()
+        with pytest.raises(PortainerException):
+            await manager.get_token()
+        await manager.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_relogin(self) -> None:
+        """Test that expired sessions trigger one shared login."""
+        api = AuthPortainerMock()
+        await api.login()
+        assert api.logins == 1
+
+        api.valid_token = ""  # noqa: S105
+        responses = await asyncio.gather(*(api.get("system/status") for _ in range(20)))
+        assert all(response["status_code"] == 200 for response in responses)
+        assert api.logins == 2
+        await api.logout()
+
+    @pytest.mark.asyncio
+    async def test_bulk_limits(self) -> None:
+        """Test bulk actions respect the limits and collect exceptions."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        containers = [
+            make_container(api, str(endpoint), f"c{index}")
+            for endpoint in range(3)
+            for index in range(5)
+        ]
+        running: dict[str, int] = {}
+        peak = {"total": 0, "endpoint": 0}
+
+        async def action(container: PortainerDockerContainer) -> str:
+            running[container.endpoint_id] = running.get(container.endpoint_id, 0) + 1
+            peak["total"] = max(peak["total"], sum(running.values()))
+            peak["endpoint"] = max(peak["endpoint"], running[container.endpoint_id])
+            await asyncio.sleep(0.01)
+            running[container.endpoint_id] -= 1
+            if container.name == "c0":
+                raise ValueError("failed")
+            return container.name
+
+        results = await run_bulk(containers, action, limit=4, endpoint_limit=2)
+        assert peak == {"total": 4, "endpoint": 2}
+        assert [result.container for result in results] == containers
+        assert sum(not result.success for result in results) == 3
+        assert results[1].result == "c1"
+
+    @pytest.mark.asyncio
+    async def test_stream_stats(self) -> None:
+        """Test streamed stats are decoded across chunk boundaries."""
+
+        async def stats(request: web.Request) -> web.StreamResponse:
+            assert request.query["stream"] == "true"
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for index in range(3):
+                line = json.dumps({"read": index}).encode() + b"\n"
+                await response.write(line[:4])
+                await response.write(line[4:])
+            return response
+
+        app = web.Application()
+        app.router.add_get(
+            "/api/endpoints/{environment_id}/docker/containers/{container_id}/stats",
+            stats,
+        )
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            api = PortainerMock(session, server.host, server.port, "admin", "pwd")
+            api._token_manager.set_token("token")
+            container = make_container(api, "1", "web")
+            samples = [sample async for sample in container.stream_stats()]
+        assert samples == [{"read": 0}, {"read": 1}, {"read": 2}]
+        assert container.stats == {"read": 2}
+
+    @pytest.mark.asyncio
+    async def test_stream_metrics(self) -> None:
+        """Test a stream closed by the consumer is not counted as error."""
+
+        async def stats(request: web.Request) -> web.StreamResponse:
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b'{"read": 0}\n')
+            await asyncio.sleep(1)
+            return response
+
+        app = web.Application()
+        app.router.add_get(
+            "/api/endpoints/{environment_id}/docker/containers/{container_id}/stats",
+            stats,
+        )
+        metrics = PortainerMetrics()
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            api = PortainerMock(session, server.host, server.port, "admin", "pwd")
+            api._token_manager.set_token("token")
+            api.add_request_hook(metrics)
+            container = make_container(api, "1", "web")
+            async with aclosing(container.stream_stats()) as samples:
+                async for _ in samples:
+                    break
+        snapshot = metrics.snapshot()[
+            "GET endpoints/{environment_id}/docker/containers/{container_id}/stats"
+        ]
+        assert snapshot["count"] == 1
+        assert snapshot["errors"] == 0
+        assert snapshot["bytes"] == len(b'{"read": 0}\n')
+
+    @pytest.mark.asyncio
+    async def test_stream_read_timeout(self) -> None:
+        """Test a stalled stream raises PortainerRequestException."""
+
+        async def stats(request: web.Request) -> web.StreamResponse:
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b'{"read": 0}\n')
+            await asyncio.sleep(1)
+            return response
+
+        app = web.Application()
+        app.router.add_get(
+            "/api/endpoints/{environment_id}/docker/containers/{container_id}/stats",
+            stats,
+        )
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            api = PortainerMock(session, server.host, server.port, "admin", "pwd")
+            api._token_manager.set_token("token")
+            api.circuit_breaker = PortainerCircuitBreaker(failure_threshold=1)
+            container = make_container(api, "1", "web")
+            samples = []
+            with pytest.raises(PortainerRequestException):
+                async for sample in container.stream_stats(read_timeout=0.05):
+                    samples.append(sample)
+        assert samples == [{"read": 0}]
+        assert api.circuit_breaker.is_open(1)
+
+    def test_container_stats(self) -> None:
+        """Test the derived stats values."""
+
+        def sample(second: int, total: int, system: int, rx_bytes: int) -> dict:
+            return {
+                "read": f"2023-05-01T10:00:0{second}.123456789Z",
+                "cpu_stats": {
+                    "cpu_usage": {"total_usage": total},
+                    "system_cpu_usage": system,
+                    "online_cpus": 2,
+                },
+                "precpu_stats": {},
+                "memory_stats": {
+                    "usage": 300,
+                    "limit": 1000,
+                    "stats": {"inactive_file": 100},
+                },
+                "networks": {"eth0": {"rx_bytes": rx_bytes, "tx_bytes": 0}},
+                "blkio_stats": {
+                    "io_service_bytes_recursive": [{"op": "read", "value": 5}]
+                },
+            }
+
+        first = ContainerStats(sample(0, 100, 1000, 0))
+        assert first.cpu_percent == 0
+        assert first.memory_usage == 200
+        assert first.memory_percent == 20
+        assert first.block_read == 5
+
+        second = ContainerStats(sample(2, 150, 1100, 1000), first)
+        assert second.cpu_percent == 100
+        assert second.network_rx_rate == 500
+
+    def test_endpoint_diff(self) -> None:
+        """Test refreshing an endpoint reports and prunes changes."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        endpoint = PortainerEndpoint(
+            api,
+            make_endpoint(
+                1,
+                [make_snapshot_container("1", "a"), make_snapshot_container("1", "b")],
+            ),
+        )
+        diffs: list[PortainerContainerDiff] = []
+
+        def failing_listener(*_: object) -> None:
+            raise ValueError("listener failed")
+
+        endpoint.add_listener(failing_listener)
+        remove_listener = endpoint.add_listener(lambda _, diff: diffs.append(diff))
+        container_a = endpoint.docker_container["a"]
+
+        diff = endpoint.after_refresh(
+            make_endpoint(
+                1,
+                [
+                    make_snapshot_container("1", "a", "exited"),
+                    make_snapshot_container("1", "c"),
+                ],
+            )
+        )
+        assert diffs == [diff]
+        assert diff.changed == [container_a]
+        assert [container.name for container in diff.added] == ["c"]
+        assert [container.name for container in diff.removed] == ["b"]
+        assert list(endpoint.docker_container) == ["a", "c"]
+
+        remove_listener()
+        assert not endpoint.after_refresh(
+            make_endpoint(
+                1,
+                [
+                    make_snapshot_container("1", "a", "exited"),
+                    make_snapshot_container("1", "c"),
+                ],
+            )
+        )
+        assert len(diffs) == 1
+
+    @pytest.mark.asyncio
+    async def test_coordinator(self) -> None:
+        """Test the coordinator shares requests and adapts intervals."""
+        api = EndpointsPortainerMock(
+            [make_endpoint(1, [make_snapshot_container("1", "a")])]
+        )
+        coordinator = PortainerCoordinator(api, interval=10, min_interval=1)
+        await coordinator.refresh_endpoints()
+        assert list(coordinator.endpoints) == [1]
+
+        diffs: list[PortainerContainerDiff] = []
+        coordinator.subscribe(lambda _, diff: diffs.append(diff), 1)
+        await asyncio.gather(*(coordinator.refresh_endpoint(1) for _ in range(5)))
+        assert api.requests == ["endpoints", "endpoints/1"]
+        assert coordinator._intervals[1] == 20
+
+        api.endpoints = [make_endpoint(1, [make_snapshot_container("1", "b")])]
+        await coordinator.refresh_endpoint(1)
+        assert len(diffs) == 1
+        assert coordinator._intervals[1] == 1
+
+    @pytest.mark.asyncio
+    async def test_response_cache(self) -> None:
+        """Test cached responses, revalidation and invalidation."""
+        api = EndpointsPortainerMock([make_endpoint(1, [])])
+        api.cache = PortainerResponseCache({"endpoints/{environment_id}": 60})
+        execute = api._execute_request
+        conditional: list[str | None] = []
+
+        async def execute_request(
+            method: str, url: str, params: dict | None, headers: dict | None = None
+        ) -> dict:
+            assert headers is not None
+            conditional.append(headers.get("If-None-Match"))
+            if headers.get("If-None-Match") == "v1":
+                return {"status_code": 304, "body": ""}
+            response = await execute(method, url, params, headers)
+            response["headers"] = {"ETag": "v1"}
+            return response
+
+        api._execute_request = execute_request  # type: ignore[method-assign]
+        first = await api.get("endpoints/1")
+        assert await api.get("endpoints/1") is first
+        assert api.requests == ["endpoints/1"]
+
+        api.cache.get("endpoints/1").expires = 0  # type: ignore[union-attr]
+        assert await api.get("endpoints/1") is first
+        assert conditional == [None, "v1"]
+
+        await api.post("endpoints/1/docker/containers/a/stop")
+        assert len(api.cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_iter_endpoints(self) -> None:
+        """Test paging through the endpoints."""
+        api = EndpointsPortainerMock([make_endpoint(index, []) for index in range(5)])
+        endpoints = [endpoint async for endpoint in api.iter_endpoints(page_size=2)]
+        assert [endpoint.endpoint_id for endpoint in endpoints] == list(range(5))
+        assert len(api.requests) == 3
+
+    def test_lazy_endpoint(self) -> None:
+        """Test lazy container creation and endpoints without snapshots."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        endpoint = PortainerEndpoint(
+            api, make_endpoint(1, [make_snapshot_container("1", "a")]), lazy=True
+        )
+        assert not endpoint._docker_container
+        assert list(endpoint.docker_container) == ["a"]
+
+        raw = make_endpoint(1, [])
+        raw["Snapshots"] = []
+        assert not endpoint.after_refresh(raw)
+        assert list(endpoint.docker_container) == ["a"]
+
+        # Loaded without containers, the next refresh reports the new ones
+        endpoint = PortainerEndpoint(api, make_endpoint(2, []), lazy=True)
+        index = PortainerContainerIndex()
+        index.add_endpoint(endpoint)
+        diff = endpoint.after_refresh(
+            make_endpoint(2, [make_snapshot_container("2", "a")])
+        )
+        assert [container.name for container in diff.added] == ["a"]
+        assert len(index) == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_and_circuit_breaker(self) -> None:
+        """Test retrying failed requests and failing fast on open circuits."""
+        api = EndpointsPortainerMock([])
+        api.retry_policy = PortainerRetryPolicy(attempts=3, backoff=0)
+        api.circuit_breaker = PortainerCircuitBreaker(failure_threshold=4)
+        responses = [
+            {"status_code": 503, "headers": {"Retry-After": "0"}, "body": ""},
+            {"status_code": 200, "body": "ok"},
+        ]
+        calls: list[str] = []
+
+        async def execute_request(
+            method: str, url: str, params: dict | None, headers: dict | None = None
+        ) -> dict:
+            calls.append(method)
+            if not responses:
+                raise PortainerRequestException(asyncio.TimeoutError())
+            return responses.pop(0)
+
+        api._execute_request = execute_request  # type: ignore[method-assign]
+        assert (await api.get("endpoints/1/docker/info"))["body"] == "ok"
+        assert len(calls) == 2
+
+        with pytest.raises(PortainerRequestException):
+            await api.post("endpoints/1/docker/containers/a/stop")
+        assert len(calls) == 3
+        with pytest.raises(PortainerRequestException):
+            await api.get("endpoints/1/docker/info")
+        with pytest.raises(PortainerCircuitOpenException):
+            await api.get("endpoints/1/docker/info")
+        assert len(calls) == 6
+        assert parse_retry_after("2") == 2
+
+        # A trial request without outcome doesn't block the environment
+        breaker = PortainerCircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure(1)
+        await asyncio.sleep(0.05)
+        breaker.check(1)
+        with pytest.raises(PortainerCircuitOpenException):
+            breaker.check(1)
+        await asyncio.sleep(0.05)
+        breaker.check(1)
+
+    @pytest.mark.asyncio
+    async def test_owned_session(self) -> None:
+        """Test the owned session is created on use and closed on exit."""
+        async with Portainer(None, "192.168.0.1", 9000, "admin", "pwd") as api:
+            assert api.connection_pool_stats()["limit"] == 0
+            session = api._get_session()
+            assert api.connection_pool_stats()["limit_per_host"] == 20
+        assert session.closed
+
+    @pytest.mark.asyncio
+    async def test_request_metrics(self) -> None:
+        """Test request events are aggregated per API."""
+        api = EndpointsPortainerMock([make_endpoint(1, [])])
+        metrics = PortainerMetrics()
+        remove_hook = api.add_request_hook(metrics)
+        await api.get("endpoints/1")
+        await api.get("endpoints/1")
+        await api.get("endpoints/2")
+        remove_hook()
+        await api.get("endpoints/1")
+
+        snapshot = metrics.snapshot()["GET endpoints/{environment_id}"]
+        assert snapshot["count"] == 3
+        assert snapshot["errors"] == 1
+        assert 0 < snapshot["latency_p50"] <= snapshot["latency_p99"]
+
+    def test_json_decoder(self) -> None:
+        """Test the JSON backends decode alike and raise the same error."""
+        for backend in ("auto", "json"):
+            decoder = PortainerJSONDecoder(backend, typed=True)
+            assert decoder.decode(b'{"Id": 1}', "endpoints/1") == {"Id": 1}
+            with pytest.raises(json.JSONDecodeError):
+                decoder.decode(b"{", "endpoints/1")
+        with pytest.raises(ValueError):
+            PortainerJSONDecoder("yaml")
+
+    @pytest.mark.asyncio
+    async def test_apply_docker_events(self) -> None:
+        """Test docker events update the containers of an endpoint."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        endpoint = PortainerEndpoint(
+            api, make_endpoint(1, [make_snapshot_container("1", "a")])
+        )
+
+        async def get_live_containers(filters: dict | None = None) -> list[dict]:
+            assert filters == {"id": ["1-b"]}
+            return [make_snapshot_container("1", "b", "created")]
+
+        endpoint.get_live_containers = (  # type: ignore[method-assign]
+            get_live_containers
+        )
+
+        diff = await endpoint._apply_event({"Action": "die", "Actor": {"ID": "1-a"}})
+        assert diff.changed == [endpoint.docker_container["a"]]
+        assert endpoint.docker_container["a"].state == "exited"
+
+        diff = await endpoint._apply_event({"Action": "create", "Actor": {"ID": "1-b"}})
+        assert [container.name for container in diff.added] == ["b"]
+
+        diff = await endpoint._apply_event({"status": "destroy", "id": "1-a"})
+        assert [container.name for container in diff.removed] == ["a"]
+        assert list(endpoint.docker_container) == ["b"]
+
+    @pytest.mark.asyncio
+    async def test_watch_events_reconnect(self) -> None:
+        """Test the events stream reconnects after it breaks or errors."""
+        connections: list[web.Request] = []
+
+        def event(action: str, time_nano: int) -> bytes:
+            return json.dumps(
+                {
+                    "Action": action,
+                    "Actor": {"ID": "1-a"},
+                    "time": time_nano // 1_000_000_000,
+                    "timeNano": time_nano,
+                }
+            ).encode()
+
+        async def events(request: web.Request) -> web.StreamResponse:
+            connections.append(request)
+            if len(connections) == 2:
+                return web.json_response(
+                    {"message": "agent offline", "details": ""}, status=502
+                )
+            response = web.StreamResponse()
+            await response.prepare(request)
+            if len(connections) == 1:
+                await response.write(event("die", 1_000_000_000) + b"\n")
+                # Reset the connection in the middle of the stream
+                assert request.transport is not None
+                request.transport.close()
+            elif len(connections) == 3:
+                await response.write(b'{"Action": "sta\n')
+            else:
+                await response.write(event("start", 1_000_000_005) + b"\n")
+            await asyncio.sleep(1)
+            return response
+
+        async def containers(request: web.Request) -> web.Response:
+            return web.json_response([make_snapshot_container("1", "a", "exited")])
+
+        app = web.Application()
+        app.router.add_get("/api/endpoints/1/docker/events", events)
+        app.router.add_get("/api/endpoints/1/docker/containers/json", containers)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            api = Portainer(session, server.host, server.port, "admin", "pwd")
+            api._token_manager.set_token("token")
+            endpoint = PortainerEndpoint(
+                api, make_endpoint(1, [make_snapshot_container("1", "a")])
+            )
+            received = []
+            async for event in endpoint.watch_events(reconnect_delay=0.01):
+                received.append(event["Action"])
+                if len(received) == 2:
+                    break
+        assert received == ["die", "start"]
+        assert len(connections) == 4
+        assert connections[2].query["since"] == "1.000000001"
+        assert connections[3].query["since"] == "1.000000001"
+        assert endpoint.docker_container["a"].state == "running"
+
+    @pytest.mark.asyncio
+    async def test_refresh_live_containers(self) -> None:
+        """Test refreshing filtered containers with one live request."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        endpoint = PortainerEndpoint(
+            api,
+            make_endpoint(
+                1,
+                [make_snapshot_container("1", "a"), make_snapshot_container("1", "b")],
+            ),
+        )
+        requests: list[dict | None] = []
+
+        async def get_live_containers(filters: dict | None = None) -> list[dict]:
+            requests.append(filters)
+            return [make_snapshot_container("1", "a", "exited")]
+
+        endpoint.get_live_containers = (  # type: ignore[method-assign]
+            get_live_containers
+        )
+        diff = await endpoint.refresh_containers(label=["app=web"])
+        assert requests == [{"label": ["app=web"]}]
+        assert diff.changed == [endpoint.docker_container["a"]]
+        assert list(endpoint.docker_container) == ["a", "b"]
+
+        diff = await endpoint.refresh_containers()
+        assert [container.name for container in diff.removed] == ["b"]
+
+    @pytest.mark.asyncio
+    async def test_redeploy_stack(self) -> None:
+        """Test redeploying a stack on many endpoints."""
+        api = EndpointsPortainerMock([])
+        stacks = [
+            {"Id": 1, "Name": "web", "EndpointId": 1, "Status": 1},
+            {"Id": 2, "Name": "web", "EndpointId": 2, "Status": 1},
+            {"Id": 3, "Name": "web", "EndpointId": 3, "GitConfig": {"URL": "repo"}},
+            {"Id": 4, "Name": "db", "EndpointId": 1, "Status": 1},
+        ]
+        calls: list[tuple[str, str]] = []
+
+        async def execute_request(
+            method: str, url: str, params: dict | None, headers: dict | None = None
+        ) -> dict:
+            api_path = url[len(api._base_url) + 1 :]
+            calls.append((method, api_path))
+            if api_path == "stacks":
+                return {"status_code": 200, "body": stacks}
+            if api_path.endswith("/file"):
+                return {"status_code": 200, "body": {"StackFileContent": "services:"}}
+            if api_path.startswith("stacks/2?"):
+                return {"status_code": 500, "body": {"message": "failed"}}
+            stack_id = int(api_path.split("/")[1].split("?")[0])
+            return {"status_code": 200, "body": stacks[stack_id - 1]}
+
+        api._execute_request = execute_request  # type: ignore[method-assign]
+        progress: list[tuple[int, str]] = []
+        results = await api.redeploy_stack(
+            "web",
+            endpoint_ids=[1, 2, 3],
+            progress=lambda stack, state, exp: progress.append((stack.stack_id, state)),
+        )
+        assert [result.success for result in results] == [True, False, True]
+        assert isinstance(results[1].exception, PortainerException)
+        assert ("PUT", "stacks/1?endpointId=1") in calls
+        assert ("PUT", "stacks/3/git/redeploy?endpointId=3") in calls
+        assert ("GET", "stacks/3/file") not in calls
+        assert sorted(progress) == [
+            (1, "done"),
+            (1, "started"),
+            (2, "failed"),
+            (2, "started"),
+            (3, "done"),
+            (3, "started"),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_check_image_updates(self) -> None:
+        """Test image statuses are requested once per image and cached."""
+        api = EndpointsPortainerMock([])
+        endpoints = [
+            PortainerEndpoint(
+                api,
+                make_endpoint(
+                    endpoint_id,
+                    [
+                        make_snapshot_container(str(endpoint_id), name)
+                        for name in ("a", "b", "c")
+                    ],
+                ),
+            )
+            for endpoint_id in (1, 2)
+        ]
+        for endpoint in endpoints:
+            endpoint.docker_container["c"].image = "redis:7"
+        calls: list[str] = []
+
+        async def execute_request(
+            method: str, url: str, params: dict | None, headers: dict | None = None
+        ) -> dict:
+            calls.append(url)
+            return {"status_code": 200, "body": {"Status": "outdated"}}
+
+        api._execute_request = execute_request  # type: ignore[method-assign]
+        results = await api.check_image_updates(endpoints)
+        assert len(calls) == 2
+        assert [result.result for result in results] == ["outdated"] * 6
+        assert endpoints[1].docker_container["b"].image_status == "outdated"
+
+        results = await endpoints[0].check_image_updates()
+        assert len(calls) == 2
+        assert all(result.success for result in results)
+
+    def test_compact_container(self) -> None:
+        """Test containers are slotted and keep only whitelisted labels."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        api.label_whitelist = frozenset(["app"])
+        raw = make_snapshot_container("1", "a")
+        raw["Labels"] = {"app": "web", "maintainer": "someone"}
+        container = PortainerDockerContainer(api, "1", raw)
+        other = make_container(api, "1", "b")
+        assert not hasattr(container, "__dict__")
+        assert container.labels == {"app": "web"}
+        assert container.image is other.image
+
+    def test_log_demuxer(self) -> None:
+        """Test docker log frames are split into lines across chunks."""
+
+        def frame(stream: int, payload: bytes) -> bytes:
+            return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+        data = frame(1, b"one\ntw") + frame(2, b"err\n") + frame(1, b"o\nthree")
+        demuxer = DockerLogDemuxer()
+        lines = []
+        for index in range(0, len(data), 5):
+            lines.extend(demuxer.feed(data[index : index + 5]))
+        lines.extend(demuxer.flush())
+        assert demuxer.multiplexed
+        assert lines == [
+            ("stdout", b"one"),
+            ("stderr", b"err"),
+            ("stdout", b"two"),
+            ("stdout", b"three"),
+        ]
+
+        demuxer = DockerLogDemuxer()
+        assert list(demuxer.feed(b"raw tty\nou")) == [("stdout", b"raw tty")]
+        assert list(demuxer.flush()) == [("stdout", b"ou")]
+
+    @pytest.mark.asyncio
+    async def test_tail_logs(self) -> None:
+        """Test streaming the logs of many containers at once."""
+
+        async def logs(request: web.Request) -> web.StreamResponse:
+            assert request.query["tail"] == "10"
+            name = request.match_info["container_id"].encode()
+            response = web.StreamResponse(
+                headers={"Content-Type": "application/vnd.docker.raw-stream"}
+            )
+            await response.prepare(request)
+            await response.write(b"2024-01-01T00:00:00Z hello " + name + b"\n")
+            return response
+
+        app = web.Application()
+        app.router.add_get(
+            "/api/endpoints/{environment_id}/docker/containers/{container_id}/logs",
+            logs,
+        )
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            api = PortainerMock(session, server.host, server.port, "admin", "pwd")
+            api._token_manager.set_token("token")
+            containers = [make_container(api, "1", name) for name in ("a", "b")]
+            lines = [
+                line async for line in tail_logs(containers, tail=10, timestamps=True)
+            ]
+        assert sorted(line.message for line in lines) == ["hello 1-a", "hello 1-b"]
+        assert lines[0].timestamp == "2024-01-01T00:00:00Z"
+
+    @pytest.mark.asyncio
+    async def test_rate_limiter(self) -> None:
+        """Test requests are admitted by priority within the rate limits."""
+        limiter = PortainerRateLimiter(
+            rate=50, burst=1, environment_rate=10, environment_burst=1
+        )
+        assert limiter.priority("POST", "endpoints/1/docker/containers/a/stop") == 0
+        assert limiter.priority("GET", "endpoints/1/docker/containers/a/stats") == 2
+        assert limiter.priority("GET", "endpoints") == 1
+        await limiter.acquire(environment_id=1)
+        admitted: list[str] = []
+
+        async def request(name: str, priority: int, environment_id: int) -> None:
+            await limiter.acquire(priority, environment_id)
+            admitted.append(name)
+
+        tasks = [
+            asyncio.ensure_future(request("low", 2, 2)),
+            asyncio.ensure_future(request("normal", 1, 3)),
+            asyncio.ensure_future(request("blocked", 0, 1)),
+            asyncio.ensure_future(request("high", 0, 4)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 4
+        await asyncio.gather(*tasks)
+        assert admitted == ["high", "normal", "low", "blocked"]
+        stats = limiter.stats()
+        assert stats["queued"] == 0
+        assert stats["waits"]["high"]["count"] == 2
+        assert stats["waits"]["low"]["max"] > 0
+
+        api = EndpointsPortainerMock([])
+        api.rate_limiter = PortainerRateLimiter(rate=100)
+        await api.post("endpoints/1/docker/containers/a/stop")
+        assert api.rate_limiter.stats()["waits"]["high"]["count"] == 1
+
+        # Every retry is admitted again
+        api.retry_policy = PortainerRetryPolicy(attempts=3, backoff=0)
+        api.failing.add("endpoints/1")
+        await api.get("endpoints/1")
+        assert api.rate_limiter.stats()["waits"]["normal"]["count"] == 3
+
+    @pytest.mark.asyncio
+    async def test_fake_portainer(self) -> None:
+        """Test the client end to end against the fake Portainer."""
+        fake = FakePortainer(endpoints=3, containers=4)
+        async with TestServer(fake.app) as server, aiohttp.ClientSession() as session:
+            api = Portainer(session, server.host, server.port, "admin", "pwd")
+            await api.login()
+            endpoints = [endpoint async for endpoint in api.iter_endpoints(2)]
+            assert [endpoint.endpoint_id for endpoint in endpoints] == [1, 2, 3]
+            raw_endpoints = await api.get_raw_endpoints(exclude_snapshots=True)
+            assert not any(endpoint["Snapshots"] for endpoint in raw_endpoints)
+            assert not await endpoints[0].refresh()
+            container = endpoints[0].docker_container["container-1"]
+            lines = [line async for line in container.stream_logs(tail=4)]
+            await container.get_stats()
+        assert [line.stream for line in lines] == ["stdout", "stderr"] * 2
+        assert container.container_stats is not None
+
+    @pytest.mark.asyncio
+    async def test_federation(self) -> None:
+        """Test querying several instances in parallel with a failing one."""
+        slow = EndpointsPortainerMock([make_endpoint(1, [])])
+
+        async def hang(*args: object) -> dict:
+            await asyncio.sleep(1)
+            return {}
+
+        slow._execute_request = hang  # type: ignore[method-assign]
+        federation = PortainerFederation(
+            {
+                "eu": EndpointsPortainerMock(
+                    [make_endpoint(1, [make_snapshot_container("1", "a")])]
+                ),
+                "us": EndpointsPortainerMock([make_endpoint(1, [])]),
+                "apac": slow,
+            },
+            timeout=0.1,
+        )
+        endpoints = await federation.get_endpoints()
+        assert sorted(endpoints.items) == ["eu:1", "us:1"]
+        assert list(endpoints.errors) == ["apac"]
+        assert not endpoints.complete
+
+        containers = await federation.get_containers()
+        assert list(containers.items) == ["eu:1:1-a"]
+        assert split_global_id("eu:1:1-a") == ("eu", "1", "1-a")
+        with pytest.raises(ValueError):
+            PortainerFederation({"a:b": slow})
+
+    @pytest.mark.asyncio
+    async def test_snapshot_store(self, tmp_path: Path) -> None:
+        """Test a warm start from the store refreshes changed endpoints only."""
+        raw_endpoints = [
+            make_endpoint(1, [make_snapshot_container("1", "a")]),
+            make_endpoint(2, [make_snapshot_container("2", "b")]),
+        ]
+        store = PortainerSnapshotStore(tmp_path / "snapshot.bin")
+        api = EndpointsPortainerMock(raw_endpoints)
+        store.save([PortainerEndpoint(api, raw, lazy=True) for raw in raw_endpoints])
+
+        raw_endpoints[1] = make_endpoint(2, [make_snapshot_container("2", "c")])
+        raw_endpoints[1]["QueryDate"] += 1
+        api = EndpointsPortainerMock(raw_endpoints)
+        coordinator = PortainerCoordinator(api, min_interval=1, store=store)
+        diffs: list[PortainerContainerDiff] = []
+        coordinator.subscribe(lambda _, diff: diffs.append(diff))
+        await coordinator.start()
+        assert all(endpoint.stale for endpoint in coordinator.endpoints.values())
+        assert list(coordinator.endpoints[2].docker_container) == ["b"]
+        await coordinator._tasks["reconcile"]
+        await coordinator.stop()
+        assert api.requests == ["endpoints", "endpoints/2"]
+        assert not any(endpoint.stale for endpoint in coordinator.endpoints.values())
+        assert list(coordinator.endpoints[2].docker_container) == ["c"]
+        assert [len(diff.added) for diff in diffs] == [1]
+        assert coordinator._intervals[2] == 1
+        assert list(store.load(api)[2].docker_container) == ["c"]
+
+        # A failed refresh keeps the endpoint stale, also in the store
+        raw_endpoints[0] = make_endpoint(1, [make_snapshot_container("1", "d")])
+        raw_endpoints[0]["QueryDate"] += 1
+        api.failing.add("endpoints/1")
+        coordinator = PortainerCoordinator(api, store=store)
+        await coordinator.start()
+        await coordinator._tasks["reconcile"]
+        await coordinator.stop()
+        assert coordinator.endpoints[1].stale
+        endpoint = store.load(api)[1]
+        assert endpoint.time == 0
+        assert list(endpoint.docker_container) == ["a"]
+
+        (tmp_path / "snapshot.bin").write_bytes(b"damaged")
+        assert not store.load(api)
+
+    @pytest.mark.asyncio
+    async def test_container_index(self) -> None:
+        """Test the index answers combined queries and follows changes."""
+        api = PortainerMock(None, "192.168.0.1", 9000, "admin", "password")
+        containers = [
+            make_snapshot_container("1", "a"),
+            make_snapshot_container("1", "b", "exited"),
+        ]
+        containers[0]["Labels"] = {"app": "web", "tier": "front"}
+        containers[1]["Labels"] = {"app": "db"}
+        endpoints = [
+            PortainerEndpoint(api, make_endpoint(1, containers), lazy=True),
+            PortainerEndpoint(
+                api, make_endpoint(2, [make_snapshot_container("2", "a")])
+            ),
+        ]
+        index = PortainerContainerIndex()
+        for endpoint in endpoints:
+            index.add_endpoint(endpoint)
+        assert len(index) == 3
+        web_container = endpoints[0].docker_container["a"]
+        assert index.query(state="running", labels={"app": "web"}) == [web_container]
+        assert index.query(labels={"tier": None}, image="nginx:latest") == [
+            web_container
+        ]
+        assert len(index.query(state="running")) == 2
+        assert index.query(container_id="1-b", state="running") == []
+
+        await endpoints[0]._apply_event({"status": "stop", "id": "1-a"})
+        assert index.query(labels={"app": "web"}, state="exited") == [web_container]
+        endpoints[0].generate_containers([make_snapshot_container("1", "c")])
+        assert index.query(endpoint_id=1) == [endpoints[0].docker_container["c"]]
+
+        # Changes made through the container itself
+        other = endpoints[1].docker_container["a"]
+        responses = [
+            {"status_code": 200, "body": make_snapshot_container("2", "a", "exited")},
+            {"status_code": 200, "body": {"Id": "2-b", "State": {"Status": "up"}}},
+        ]
+
+        async def execute_request(
+            method: str, url: str, params: dict | None, headers: dict | None = None
+        ) -> dict:
+            return responses.pop(0)
+
+        api._token_manager.set_token("token")
+        api._execute_request = execute_request  # type: ignore[method-assign]
+        await other.refresh()
+        assert index.query(endpoint_id=2, state="exited") == [other]
+        await other.recreate()
+        assert index.query(container_id="2-b") == [other]
+        assert index.query(container_id="2-a") == []
+        index.remove_endpoint(endpoints[1])
+        assert len(index) == 1
+
+    @pytest.mark.parametrize("backend", ["numpy", "array"])
+    def test_stats_history(self, backend: str) -> None:
+        """Test the ring buffer keeps the last samples and aggregates them."""
+        if backend == "numpy":
+            pytest.importorskip("numpy")
+        history = StatsHistory(capacity=4, backend=backend)
+        stats = ContainerStats({})
+        for second in range(6):
+            stats.timestamp = 1000.0 + second * 5
+            stats.cpu_percent = float(second)
+            stats.network_rx = 0 if second == 4 else 100 * second
+            history.record(stats)
+        assert len(history) == 4
+        assert list(history.values("cpu_percent")) == [2.0, 3.0, 4.0, 5.0]
+        assert history.aggregate("cpu_percent", "max") == 5
+        assert history.aggregate("cpu_percent", "p50") == 3.5
+        assert history.aggregate("cpu_percent", window=6, now=1025) == 4.5
+        assert history.rate("network_rx") == pytest.approx((100 + 500) / 15)
+        assert history.downsample("cpu_percent", 10) == [(1010.0, 2.5), (1020.0, 4.5)]
+        with pytest.raises(ValueError):
+            history.aggregate("cpu_percent", "median")
+
+    @pytest.mark.asyncio
+    async def test_endpoint_stats_history(self) -> None:
+        """Test aggregating the stats histories of an endpoint."""
+        api = EndpointsPortainerMock([])
+        api.stats_history_size = 10
+        endpoint = PortainerEndpoint(
+            api,
+            make_endpoint(
+                1,
+                [make_snapshot_container("1", "a"), make_snapshot_container("1", "b")],
+            ),
+        )
+        containers = endpoint.docker_container.values()
+        for usage, container in zip((100, 300), containers, strict=True):
+            container._set_stats({"memory_stats": {"usage": usage}}, keep_raw=False)
+        assert endpoint.aggregate_stats("memory_usage") == 200
+        assert api.aggregate_stats([endpoint], "memory_usage", "max") == 300